@@ -1,6 +1,8 @@
 from django.contrib import admin
 from library.models import (
     Book,
+    BookBlob,
+    BookPage,
     Statistics
 )
 
@@ -33,3 +35,35 @@ class LibraryStatisticsAdmin(admin.ModelAdmin):
         'average_speed',
         'edited',
     )
+
+
+@admin.register(BookPage)
+class LibraryBookPageAdmin(admin.ModelAdmin):
+    readonly_fields = (
+        'book_id',
+        'blob_id',
+    )
+
+    list_display = (
+        'book_id',
+        'blob_id',
+        'number',
+        'words',
+    )
+
+
+@admin.register(BookBlob)
+class LibraryBookBlobAdmin(admin.ModelAdmin):
+    readonly_fields = (
+        'sha256',
+        'references',
+    )
+
+    list_display = (
+        'sha256',
+        'title',
+        'author',
+        'size',
+        'references',
+        'pages',
+    )
@@ -0,0 +1,164 @@
+"""
+Async versions of the library and statistics endpoints served by ASGI.
+
+Django 4.0 has neither async class-based views nor async ORM and DRF has no async views,
+so the views keep the contract of the synchronous ones they inherit and only the handlers are async:
+the query and the book are checked by the helpers of the synchronous views,
+database queries run through sync_to_async in the thread of the connection,
+reading and parsing the book files run in a bounded pool, so the event loop is never blocked.
+"""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import MethodNotAllowed
+from rest_framework.request import Request
+from rest_framework.response import Response
+from library.cache import rendered_pages
+from library.http import (
+    cache_pages,
+    set_validators
+)
+from library.models import Book
+from library.services import WORDS_PER_PAGE
+from library.serializers import (
+    BookViewSerializer,
+    locate_word
+)
+from library.views import (
+    LibraryRetrieveViewSet,
+    StatisticsViewSet
+)
+
+# Bounded, so a burst of readers queues up instead of spawning a thread per request.
+executor = ThreadPoolExecutor(max_workers=getattr(settings, 'LIBRARY_ASYNC_WORKERS', 8),
+                              thread_name_prefix='library')
+
+def offload(func, *args):
+    """Run reading or parsing of the book in the pool, it must not query the database"""
+    return asyncio.get_running_loop().run_in_executor(executor, partial(func, *args))
+
+
+class AsyncAPIViewMixin:
+    """Dispatch the request to the async handlers of the DRF view"""
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        async def view(request, *args, **kwargs):
+            self = cls(**initkwargs)
+            self.setup(request, *args, **kwargs)
+            return await self.dispatch(request, *args, **kwargs)
+
+        view.cls = cls
+        view.initkwargs = initkwargs
+        # csrf_exempt of Django 4.0 would wrap the coroutine function into a sync one.
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            # Authentication may read the session.
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            handler = None
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), None)
+            if handler is None:
+                raise MethodNotAllowed(request.method)
+
+            response = await handler(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncLibraryRetrieveViewSet(AsyncAPIViewMixin, LibraryRetrieveViewSet):
+    __doc__ = LibraryRetrieveViewSet.__doc__
+
+    async def get(self, request: Request, *args, **kwargs):
+        params, response = self.parse_query(request)
+        if response is not None:
+            return response
+
+        book = await sync_to_async(self.find_book)(params)
+        etag, response = self.check_book(request, book, params)
+        if response is None:
+            response = cache_pages(set_validators(await self.read(book, params), etag, book.edited))
+
+        return response
+
+    async def read(self, book: Book, params: dict):
+        """The range is capped, so it's read as a whole before streaming, the word index is read by the pool"""
+        words_per_page = params['words_per_page']
+        if 'page_from' in params:
+            serializer = BookViewSerializer(book, context={'words_per_page': words_per_page})
+            book_pages = await self.read_pages(serializer, book, params['page_from'], params['page_to'])
+            pages = serializer.iter_representation(book, params['page_from'], params['page_to'], book_pages)
+            return StreamingHttpResponse([json.dumps(page) + '\n' for page in pages],
+                                         content_type='application/x-ndjson')
+
+        if 'word' in params:
+            page, offset = await offload(locate_word, book, params['word'], words_per_page)
+            data = await self.render_page(book, page, words_per_page)
+            return Response(dict(data, word=params['word'], offset=offset))
+
+        return Response(await self.render_page(book, params['page'], words_per_page))
+
+    async def render_page(self, book: Book, page, words_per_page: int = WORDS_PER_PAGE) -> dict:
+        """Serialized page shared by all the workers"""
+        data = await offload(rendered_pages.get, book, page, words_per_page)
+        if data is None:
+            context = {'page': page, 'words_per_page': words_per_page}
+            serializer = BookViewSerializer(book, partial=True, context=context)
+            serializer.context['book_pages'] = await self.read_pages(serializer, book, int(page), int(page))
+            data = serializer.data
+            await offload(rendered_pages.set, book, page, data, words_per_page)
+
+        return data
+
+    async def read_pages(self, serializer: BookViewSerializer, book: Book, first: int, last: int) -> list:
+        """Stored pages are read by the database thread, the rest are parsed by the pool"""
+        if not book.file:
+            return []
+
+        words_per_page = serializer.context.get('words_per_page', WORDS_PER_PAGE)
+        if words_per_page != WORDS_PER_PAGE:
+            # Pages of another size are cut out of the stored pages covering them.
+            index, starts = await offload(serializer.get_pagination, book, words_per_page)
+            covering = serializer.covering_pages(index, starts, first, last)
+            book_pages = await self.read_pages(BookViewSerializer(book), book, *covering)
+            return list(serializer.repaginate(index, starts, first, last, book_pages))
+
+        book_pages = await sync_to_async(serializer.get_stored_pages)(book, first, last)
+        if book_pages is None:
+            book_pages = await offload(lambda: list(serializer.parse_pages(book, first, last)))
+
+        return book_pages
+
+    async def post(self, request, *args, **kwargs):
+        return await sync_to_async(super().post)(request, *args, **kwargs)
+
+    async def delete(self, request: Request, *args, **kwargs):
+        return await sync_to_async(super().delete)(request, *args, **kwargs)
+
+
+class AsyncStatisticsViewSet(AsyncAPIViewMixin, StatisticsViewSet):
+    __doc__ = StatisticsViewSet.__doc__
+
+    async def get(self, request: Request, *args, **kwargs):
+        return await sync_to_async(super().get)(request, *args, **kwargs)
+
+    async def put(self, request, *args, **kwargs):
+        return await sync_to_async(super().put)(request, *args, **kwargs)
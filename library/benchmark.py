@@ -0,0 +1,167 @@
+import os
+import platform
+import random
+import time
+import tracemalloc
+from ebooklib import epub
+from library import sidecar
+from library.extractors import get_extractor
+from library.services import EpubParser
+
+# Amount of words and chapters of the generated books
+SIZES = {
+    'short_story': (5000, 3),
+    'novel': (100000, 30),
+    'long_novel': (500000, 120),
+    'omnibus': (2000000, 400),
+}
+# Amount of get_page calls measured
+PAGE_READS = 1000
+# Codec, level and pages per block of the sidecars compared by disk size and page read latency
+SIDECAR_OPTIONS = (
+    ('none', 0, 1),
+    ('zlib', 1, 4),
+    ('zlib', 6, 4),
+    ('zlib', 6, 16),
+    ('lzma', 6, 16),
+)
+
+_VOCABULARY = (
+    'the of and to in a is that for it as was with be by on not he I this are or his from at which but have an '
+    'they you were her she there been one all we their has would when if so no will can more about said time '
+    'reading speed chapter morning window silence remember wonderful extraordinary conversation'
+).split()
+
+
+def generate_book(path: str, words: int, chapters: int, seed: int = 0):
+    """Write synthetic EPUB-book with the given amount of words split in chapters"""
+    generator = random.Random(seed)
+    book = epub.EpubBook()
+    book.set_identifier(f'benchmark-{words}-{chapters}')
+    book.set_title(f'Benchmark {words} words')
+    book.set_language('en')
+    book.add_author('Spritz Benchmark')
+
+    items = []
+    for number in range(chapters):
+        chapter_words = words // chapters + (1 if number < words % chapters else 0)
+        paragraphs = []
+        while chapter_words > 0:
+            length = min(chapter_words, generator.randint(40, 160))
+            paragraphs.append(f'<p>{" ".join(generator.choices(_VOCABULARY, k=length))}.</p>')
+            chapter_words -= length
+
+        item = epub.EpubHtml(title=f'Chapter {number + 1}', file_name=f'chapter_{number + 1}.xhtml', lang='en')
+        item.content = f'<h1>Chapter {number + 1}</h1>\n' + '\n'.join(paragraphs)
+        book.add_item(item)
+        items.append(item)
+
+    book.toc = items
+    book.spine = ['nav', *items]
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    epub.write_epub(path, book)
+
+
+def measure(setup, function) -> dict:
+    """
+    Wall time and peak memory of the function called with the result of the setup.
+    Memory is traced in a separate run, because tracing slows the code down.
+    """
+
+    argument = setup()
+    start = time.perf_counter()
+    function(argument)
+    seconds = time.perf_counter() - start
+
+    argument = setup()
+    tracemalloc.start()
+    try:
+        function(argument)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': seconds, 'peak_bytes': peak}
+
+
+def benchmark_book(path: str) -> dict:
+    """Measure every stage of parsing and pagination of the book separately"""
+    parsed = EpubParser(path)
+    pages = len(parsed)
+    chapters = list(parsed._chapters())
+    reads = [random.Random(0).randint(1, pages) for _ in range(PAGE_READS)]
+
+    results = {
+        'construct': measure(lambda: path, lambda book_path: EpubParser(book_path, parse_text=False)),
+        'parse_text': measure(lambda: EpubParser(path, parse_text=False), lambda book: book._parse_text()),
+        'paginate': measure(lambda: EpubParser(path, parse_text=False),
+                            lambda book: list(book._paginate(iter(chapters)))),
+        'get_page': measure(lambda: parsed, lambda book: [book.get_page(page) for page in reads]),
+        'total_words': measure(lambda: parsed, lambda book: book.total_words()),
+    }
+
+    for stage in ('parse_text', 'paginate'):
+        results[stage]['pages_per_second'] = pages / results[stage]['seconds']
+    results['get_page']['pages_per_second'] = PAGE_READS / results['get_page']['seconds']
+
+    return {
+        'pages': pages,
+        'words': parsed.total_words(),
+        'file_bytes': os.path.getsize(path),
+        'stages': results,
+        'sidecars': benchmark_sidecars(path, parsed, reads),
+    }
+
+
+def benchmark_sidecars(path: str, parsed: EpubParser, reads: list) -> dict:
+    """Disk size of the sidecar against the latency of a random page read, for every compression"""
+    results = {}
+    for codec, level, pages_per_block in SIDECAR_OPTIONS:
+        options = {'codec': codec, 'level': level, 'pages_per_block': pages_per_block}
+        sidecar.write(path, parsed, **options)
+        book = sidecar.MappedBook(path, **options)
+
+        start = time.perf_counter()
+        for page in reads:
+            book.get_page(page)
+        seconds = time.perf_counter() - start
+
+        results[f'{codec}-{level}x{pages_per_block}'] = {
+            'disk_bytes': book.disk_bytes(),
+            'ratio': book.disk_bytes() / max(book.total_bytes(), 1),
+            'page_read_us': seconds / len(reads) * 1e6,
+        }
+
+    sidecar.remove(path)
+    return results
+
+
+def run(directory: str, sizes: list) -> dict:
+    """Generate the books of the given sizes in the directory and benchmark them"""
+    results = {}
+    for size in sizes:
+        words, chapters = SIZES[size]
+        path = os.path.join(directory, f'{size}.epub')
+        if not os.path.exists(path):
+            generate_book(path, words, chapters)
+
+        results[size] = benchmark_book(path)
+
+    return {
+        'python': platform.python_version(),
+        'extractor': type(get_extractor()).__name__,
+        'sizes': results,
+    }
+
+
+def compare(results: dict, baseline: dict) -> list:
+    """Ratio of the wall time of every stage to the baseline, stages missing in the baseline are skipped"""
+    ratios = []
+    for size, result in results['sizes'].items():
+        for stage, measurement in result['stages'].items():
+            base = baseline.get('sizes', {}).get(size, {}).get('stages', {}).get(stage)
+            if base:
+                ratios.append((size, stage, measurement['seconds'] / base['seconds']))
+
+    return ratios
@@ -0,0 +1,119 @@
+"""
+Content-addressed storage of the book files.
+
+Every file is stored once under its SHA-256 and referenced by all the books uploaded it.
+"""
+import hashlib
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from library import (
+    rsvp,
+    sidecar
+)
+from library.cache import parsed_books
+from library.models import BookBlob
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_hash(file) -> str:
+    """SHA-256 of the file, computed by the upload handler if possible"""
+    digest = getattr(file, 'sha256', None)
+    if digest:
+        return digest
+
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks(CHUNK_SIZE):
+        sha256.update(chunk)
+    file.seek(0)
+    return sha256.hexdigest()
+
+
+def find(file) -> BookBlob:
+    """Blob with the same content as the file, None if there is no such blob"""
+    return BookBlob.objects.all().filter(pk=content_hash(file)).first()
+
+
+def _name(digest: str, file) -> str:
+    return BookBlob.file.field.generate_filename(BookBlob(sha256=digest), file.name)
+
+
+def store(file) -> str:
+    """
+    Save the file under the name of its blob unless it's stored already, returns the name
+
+    Call it before the transaction acquiring the blob: the transaction holds the write lock of the database,
+    so the file isn't copied while the other writers wait.
+    """
+    digest = content_hash(file)
+    name = _name(digest, file)
+    if default_storage.exists(name):
+        return name
+
+    # Blob stored before might have another extension.
+    name = BookBlob.objects.all().filter(pk=digest).values_list('file', flat=True).first() or name
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, file)
+        # The same content was stored by another process in the meantime.
+        if saved != name:
+            default_storage.delete(saved)
+
+    return name
+
+
+def acquire(file, title: str, author: str) -> BookBlob:
+    """
+    Reference the blob of the file, store the file if it's missing
+
+    Call it in the transaction creating the book, so the reference is dropped along with the book.
+    The file is stored by `store` before the transaction, here it's saved only if it was removed in the meantime.
+    """
+    digest = content_hash(file)
+    name = _name(digest, file)
+    blob, created = BookBlob.objects.get_or_create(sha256=digest, defaults={
+        'file': name, 'size': file.size, 'title': title, 'author': author, 'references': 1
+    })
+    if not created:
+        BookBlob.objects.all().filter(pk=digest).update(references=F('references') + 1)
+        blob.references += 1
+        name = blob.file.name
+
+    # File of the rolled back blob might be left behind, it's the same content.
+    # File of the blob released by another transaction might be removed already, it's saved again.
+    if not default_storage.exists(name):
+        default_storage.save(name, file)
+
+    return blob
+
+
+@transaction.atomic
+def release(blob_id):
+    """Drop the reference to the blob, delete the blob and its file along with the last one"""
+    BookBlob.objects.all().filter(pk=blob_id).update(references=F('references') - 1)
+
+    blob = BookBlob.objects.all().filter(pk=blob_id, references__lte=0).first()
+    if blob is None:
+        return
+
+    name = blob.file.name
+    # Pages of the blob are deleted by the cascade.
+    blob.delete()
+    transaction.on_commit(lambda: _remove_file(blob_id, name))
+
+
+@transaction.atomic
+def _remove_file(blob_id, name: str):
+    """
+    Remove the file of the deleted blob unless the file was acquired again in the meantime
+
+    Transactions begin immediately, so no acquire commits between the check of the blob and the removal.
+    """
+    if BookBlob.objects.all().filter(pk=blob_id).exists():
+        return
+
+    parsed_books.invalidate(blob_id)
+    if default_storage.exists(name):
+        sidecar.remove(default_storage.path(name))
+        rsvp.remove(default_storage.path(name))
+        default_storage.delete(name)
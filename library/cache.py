@@ -0,0 +1,139 @@
+import os
+import uuid
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.core.cache import caches
+from library.services import (
+    WORDS_PER_PAGE,
+    BookParser
+)
+from library.sidecar import open_book
+
+
+class ParsedBookCache:
+    """
+    Per-process LRU cache of books opened from their sidecars.
+
+    The text stays in the mapped files, so eviction is bounded by the bytes every book holds in the worker:
+    its mapped index and its biggest decompressed block, rather than by amount of books.
+    Entry is stale as soon as the book was edited or its file was modified.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, path: str, edited) -> BookParser:
+        """Return parsed book by its unique_id or blob, parse it only if it's not cached or stale"""
+        key = str(key)
+        stamp = (edited, os.path.getmtime(path))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+
+        book = open_book(path)
+        size = book.retained_bytes()
+
+        with self._lock:
+            self._pop(key)
+            # Book that doesn't fit the whole cache would just flush everything else.
+            if size <= self.max_bytes:
+                self._entries[key] = (stamp, book, size)
+                self._bytes += size
+                self._evict()
+
+        return book
+
+    def invalidate(self, key):
+        """Drop the book or the blob from the cache"""
+        with self._lock:
+            self._pop(str(key))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        """Counters to size the cache per worker"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RenderedPageCache:
+    """
+    Serialized pages shared by all the workers through Django cache framework.
+
+    Keys of every book are in its own namespace, so the whole book is dropped
+    by replacing the namespace without scanning the keys.
+    """
+
+    def __init__(self, alias: str):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, book, page, words_per_page: int = WORDS_PER_PAGE):
+        return self.cache.get(self._key(book, page, words_per_page))
+
+    def set(self, book, page, data: dict, words_per_page: int = WORDS_PER_PAGE):
+        self.cache.set(self._key(book, page, words_per_page), data)
+
+    def invalidate(self, unique_id):
+        """Drop every page of the book"""
+        self.cache.delete(self._namespace_key(unique_id))
+
+    def _namespace_key(self, unique_id) -> str:
+        return f'library:book:{unique_id}'
+
+    def _namespace(self, unique_id) -> str:
+        key = self._namespace_key(unique_id)
+        namespace = self.cache.get(key)
+        if namespace is None:
+            # Another worker may have created it in the meantime.
+            self.cache.add(key, uuid.uuid4().hex, timeout=None)
+            namespace = self.cache.get(key)
+
+        return namespace
+
+    def _key(self, book, page, words_per_page: int) -> str:
+        return f'library:page:{self._namespace(book.unique_id)}:{book.edited.timestamp()}:{page}:{words_per_page}'
+
+
+parsed_books = ParsedBookCache(getattr(settings, 'LIBRARY_PARSED_BOOKS_CACHE_BYTES', 64 * 1024 * 1024))
+rendered_pages = RenderedPageCache(getattr(settings, 'LIBRARY_PAGE_CACHE', 'default'))
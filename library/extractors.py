@@ -0,0 +1,74 @@
+import re
+from functools import lru_cache
+from bs4 import (
+    BeautifulSoup,
+    UnicodeDammit
+)
+from django.conf import settings
+from django.utils.module_loading import import_string
+from lxml import etree
+from lxml.html import fragment_fromstring
+
+# Every new line, tab, escape sequence and multiple spaces become a single space.
+_WHITESPACE = re.compile(r'\s+')
+# Text of these elements isn't a part of the book text.
+_SKIPPED_TAGS = ('script', 'style', 'template')
+
+
+class TextExtractor:
+    """
+    Base class of HTML to text extraction backend
+
+    Returns normalized text of the chapter body.
+    """
+
+    def extract(self, html: bytes) -> str:
+        raise NotImplementedError
+
+    def _normalize(self, text: str) -> str:
+        return _WHITESPACE.sub(' ', text).strip()
+
+
+class SoupExtractor(TextExtractor):
+    """Extraction through BeautifulSoup"""
+
+    def extract(self, html: bytes) -> str:
+        return self._normalize(BeautifulSoup(html, 'html.parser').get_text())
+
+
+class LxmlExtractor(TextExtractor):
+    """
+    Extraction through lxml itertext
+
+    Output is the same as of SoupExtractor.
+    Chapters lxml can't handle are passed to SoupExtractor.
+    """
+
+    _fallback = SoupExtractor()
+
+    def extract(self, html: bytes) -> str:
+        try:
+            text = html.decode('utf-8')
+        except UnicodeDecodeError:
+            text = UnicodeDammit(html).unicode_markup
+
+        if not text.strip():
+            return ''
+
+        try:
+            root = fragment_fromstring(text, create_parent='div')
+        except (ValueError, etree.ParserError):
+            return self._fallback.extract(html)
+
+        etree.strip_elements(root, *_SKIPPED_TAGS, with_tail=False)
+        return self._normalize(''.join(root.itertext()))
+
+
+def get_extractor(path: str = None) -> TextExtractor:
+    """Extraction backend by its dotted path, the one from settings by default"""
+    return _load_extractor(path or getattr(settings, 'LIBRARY_TEXT_EXTRACTOR', 'library.extractors.LxmlExtractor'))
+
+
+@lru_cache(maxsize=None)
+def _load_extractor(path: str) -> TextExtractor:
+    return import_string(path)()
@@ -0,0 +1,72 @@
+import hashlib
+from datetime import datetime
+from django.conf import settings
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control
+)
+from django.utils.http import (
+    http_date,
+    quote_etag
+)
+from library import rsvp
+from library.models import (
+    Book,
+    Statistics
+)
+from library.services import (
+    WORDS_PER_PAGE,
+    BookParser
+)
+
+
+def _etag(*parts) -> str:
+    return quote_etag(hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest())
+
+
+def page_etag(book: Book, first: int, last: int, words_per_page: int = WORDS_PER_PAGE) -> str:
+    """Strong ETag of the pages, they only change with the book or the pagination rules"""
+    return _etag(book.unique_id, book.edited.isoformat(), first, last,
+                 words_per_page, BookParser.NORMALIZATION_VERSION)
+
+
+def words_etag(book: Book, first: int, count: int) -> str:
+    """Strong ETag of the word stream, it changes with the pages and the computation of the delays"""
+    return _etag(page_etag(book, first, count), 'words', rsvp.FORMAT_VERSION)
+
+
+def position_etag(book: Book, word: int, words_per_page: int = WORDS_PER_PAGE) -> str:
+    """Strong ETag of the page containing the word, the position of the word is included"""
+    return _etag(page_etag(book, word, word, words_per_page), 'position', rsvp.FORMAT_VERSION)
+
+
+def statistics_etag(stat: Statistics) -> str:
+    # Last-Modified is precise to seconds only, so statistics have ETag as well.
+    return _etag(stat.pk, stat.edited.isoformat())
+
+
+def not_modified(request, etag: str, last_modified: datetime):
+    """304 response if the client already has the resource, None otherwise"""
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is not None:
+        return set_validators(response, etag, last_modified)
+
+    return None
+
+
+def set_validators(response, etag: str, last_modified: datetime):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def cache_pages(response):
+    """Pages may be cached by the clients and CDN"""
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'LIBRARY_PAGE_MAX_AGE', 300))
+    return response
+
+
+def cache_statistics(response):
+    """Statistics are private and change often, so clients always revalidate them"""
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,187 @@
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from library import (
+    blobs,
+    rsvp,
+    sidecar
+)
+from library.cache import rendered_pages
+from library.models import (
+    Book,
+    BookBlob,
+    BookPage
+)
+from library.services import EpubParser
+
+logger = logging.getLogger(__name__)
+
+
+def parse_book(path: str) -> dict:
+    """
+    Parse and paginate the book, write the word index of its RSVP stream.
+
+    Runs in a worker process, that's why it doesn't touch the DB.
+    Returns pages with the amount of words.
+    The sidecar is built on the first read of the book repaginated or streamed, the pages are stored compressed.
+    """
+
+    book = EpubParser(path)
+    rsvp.write(path, book)
+
+    return {
+        'pages': list(book),
+    }
+
+
+def import_book(path: str) -> dict:
+    """
+    Hash, parse and paginate the book file to be imported, build the word index of its RSVP stream.
+
+    Runs in a worker process, that's why it doesn't touch the DB.
+    The file is stored by the importer, along with the blob it's referenced by and the word index.
+    """
+
+    book = EpubParser(path)
+    with open(path, 'rb') as file:
+        sha256 = blobs.content_hash(File(file))
+
+    return {
+        'sha256': sha256,
+        'title': book.title,
+        'author': book.author,
+        'pages': list(book),
+        'rsvp': rsvp.build(book),
+        'size': os.path.getsize(path),
+    }
+
+
+def requeue_stale(timeout: float = None) -> int:
+    """
+    Return the books claimed too long ago to the queue, their worker must have crashed or been killed
+
+    Returns amount of requeued books.
+    """
+    timeout = getattr(settings, 'LIBRARY_INGEST_TIMEOUT', 600) if timeout is None else timeout
+    requeued = Book.objects.all().filter(
+        state=Book.State.PROCESSING, claimed__lt=timezone.now() - timedelta(seconds=timeout)
+    ).update(state=Book.State.PENDING, claimed=None)
+    if requeued:
+        logger.warning('Requeued %s books claimed more than %ss ago', requeued, timeout)
+
+    return requeued
+
+
+def claim_pending(limit: int = None) -> list:
+    """Mark pending books as processing, so no other worker takes them"""
+    books = []
+
+    requeue_stale()
+    for book in Book.objects.all().filter(state=Book.State.PENDING).only('pk')[:limit]:
+        claimed = Book.objects.all().filter(pk=book.pk, state=Book.State.PENDING).update(
+            state=Book.State.PROCESSING, claimed=timezone.now()
+        )
+        if claimed:
+            books.append(Book.objects.select_related('blob_id').get(pk=book.pk))
+
+    return books
+
+
+def build_pages(book: Book, pages: list) -> list:
+    return [
+        BookPage(**book.content_owner(), number=number, data=sidecar.pack_page(text), words=words)
+        for number, (text, words) in enumerate(pages, start=1)
+    ]
+
+
+def finish(book: Book, **fields) -> bool:
+    """
+    Write the state of the claimed book, False if the book was deleted in the meantime
+
+    The book is never saved, save() would insert the deleted book again.
+    """
+    return bool(Book.objects.all().filter(pk=book.pk, state=Book.State.PROCESSING).update(
+        edited=timezone.now(), **fields
+    ))
+
+
+@transaction.atomic
+def save_book(book: Book, result: dict) -> bool:
+    """Save paginated text and mark the book ready, False if the book was deleted"""
+    pages = len(result['pages'])
+    words = sum(words for _, words in result['pages'])
+
+    # No pages are written for the deleted book, its blob might be deleted as well.
+    if not finish(book, pages=pages, words=words, state=Book.State.READY):
+        return False
+
+    # Pages of the blob are saved by the first of its books only.
+    if not book.blob_id_id or BookBlob.objects.all().filter(pk=book.blob_id_id, pages__isnull=True).update(
+            pages=pages, words=words):
+        owner = book.content_owner()
+        BookPage.objects.all().filter(**owner).delete()
+        BookPage.objects.bulk_create(build_pages(book, result['pages']))
+
+    transaction.on_commit(lambda: rendered_pages.invalidate(book.unique_id))
+    return True
+
+
+def save_parsed(book: Book) -> bool:
+    """Mark the book ready, its blob was paginated for another book"""
+    return finish(book, pages=book.blob_id.pages, words=book.blob_id.words, state=Book.State.READY)
+
+
+def fail(book: Book, error: Exception) -> bool:
+    logger.error('Failed to ingest book %s: %s', book, error)
+    return finish(book, state=Book.State.FAILED)
+
+
+def ingest_pending(workers: int = None, limit: int = None) -> int:
+    """
+    Parse pending books in a pool of processes.
+    Zero workers parse the books in the current process.
+    Every file is parsed once, however many books share it.
+
+    Returns amount of processed books, the books deleted during the processing are skipped.
+    """
+
+    books = claim_pending(limit)
+    if not books:
+        return 0
+
+    parsed = [book for book in books if book.blob_id and book.blob_id.pages is not None]
+    processed = sum(save_parsed(book) for book in parsed)
+
+    books = [book for book in books if book not in parsed]
+    paths = {book.file.path for book in books}
+
+    if workers == 0:
+        results = {path: _call(parse_book, path) for path in paths}
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {path: executor.submit(parse_book, path) for path in paths}
+            results = {path: _call(future.result) for path, future in futures.items()}
+
+    for book in books:
+        try:
+            result = results[book.file.path]
+            if isinstance(result, Exception):
+                raise result
+            processed += save_book(book, result)
+        except Exception as error:
+            processed += fail(book, error)
+
+    return processed
+
+
+def _call(func, *args):
+    """Result of the function, or the error it raised"""
+    try:
+        return func(*args)
+    except Exception as error:
+        return error
@@ -0,0 +1,58 @@
+import json
+import tempfile
+from django.core.management.base import (
+    BaseCommand,
+    CommandError
+)
+from library import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Benchmark parsing and pagination over synthetic EPUB-books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', choices=list(benchmark.SIZES), default=list(benchmark.SIZES))
+        parser.add_argument('--directory', help='Where to keep generated books, temporary directory by default')
+        parser.add_argument('--output', help='Write results as JSON to the file')
+        parser.add_argument('--baseline', help='Compare results with the JSON of the previous run')
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help='Fail if any stage is this many times slower than the baseline')
+
+    def handle(self, *args, **options):
+        if options['directory']:
+            results = benchmark.run(options['directory'], options['sizes'])
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                results = benchmark.run(directory, options['sizes'])
+
+        for size, result in results['sizes'].items():
+            self.stdout.write(f'{size}: {result["words"]} words, {result["pages"]} pages, {result["file_bytes"]} bytes')
+            for stage, measurement in result['stages'].items():
+                pages_per_second = measurement.get('pages_per_second')
+                self.stdout.write(
+                    f'  {stage:<12} {measurement["seconds"]:10.4f}s {measurement["peak_bytes"] / 1024:12.1f} KiB'
+                    + (f' {pages_per_second:12.1f} pages/s' if pages_per_second else '')
+                )
+            for name, sidecar in result['sidecars'].items():
+                self.stdout.write(
+                    f'  sidecar {name:<12} {sidecar["disk_bytes"] / 1024:10.1f} KiB {sidecar["ratio"]:6.2f}x of text '
+                    f'{sidecar["page_read_us"]:10.1f} us/page'
+                )
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        if not options['baseline']:
+            return
+
+        with open(options['baseline']) as file:
+            ratios = benchmark.compare(results, json.load(file))
+
+        for size, stage, ratio in ratios:
+            self.stdout.write(f'{size} {stage}: {ratio:.2f}x of the baseline')
+
+        regressions = [f'{size} {stage}' for size, stage, ratio in ratios
+                       if options['max_regression'] and ratio > options['max_regression']]
+        if regressions:
+            raise CommandError(f'Regressions: {", ".join(regressions)}')
@@ -0,0 +1,147 @@
+import time
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    as_completed
+)
+from pathlib import Path
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from library import (
+    blobs,
+    rsvp
+)
+from library.ingest import (
+    build_pages,
+    import_book
+)
+from library.models import (
+    Book,
+    BookBlob,
+    BookPage
+)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Import directory of EPUB files to the user library'
+
+    def add_arguments(self, parser):
+        parser.add_argument('directory', type=Path)
+        parser.add_argument('--vk-id', type=int, required=True)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Amount of parsing processes, amount of CPUs by default')
+        parser.add_argument('--batch', type=int, default=50,
+                            help='Amount of books written to the DB in a single transaction')
+
+    def handle(self, *args, **options):
+        user, _ = User.objects.get_or_create(vk_id=options['vk_id'])
+        paths = sorted(options['directory'].rglob('*.epub'))
+        self.imported, self.duplicates, self.size = 0, 0, 0
+        failures = []
+        batch = []
+        start = time.perf_counter()
+
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {}
+            for path in paths:
+                book = Book(vk_id=user, state=Book.State.READY)
+                futures[executor.submit(import_book, str(path))] = (book, path)
+
+            for future in as_completed(futures):
+                book, path = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    failures.append((path, error))
+                    continue
+
+                batch.append((book, path, result))
+                if len(batch) >= options['batch']:
+                    self._flush(batch)
+                    batch = []
+
+        self._flush(batch)
+        elapsed = time.perf_counter() - start
+
+        for path, error in failures:
+            self.stderr.write(f'{path}: {error}')
+
+        self.stdout.write(
+            f'Imported {self.imported}, skipped {self.duplicates} duplicates, failed {len(failures)} '
+            f'of {len(paths)} books in {elapsed:.2f}s: '
+            f'{self.imported / elapsed:.2f} books/s, {self.size / elapsed / 1024 / 1024:.2f} MB/s'
+        )
+
+    @staticmethod
+    def _file(path: Path, result: dict) -> File:
+        file = File(open(path, 'rb'), name=path.name)
+        file.sha256 = result['sha256']
+        return file
+
+    def _flush(self, batch: list):
+        """
+        Write the books and their pages, skip books which are already in the library
+
+        Files are stored once per content, along with the uploaded ones, and paginated by the first of their books.
+        The transaction holds the write lock of the database, so the files are copied and the pages compressed
+        before it.
+        """
+        if not batch:
+            return
+
+        for book, path, result in batch:
+            with self._file(path, result) as file:
+                name = blobs.store(file)
+
+            book.blob_id_id = result['sha256']
+            book.title = result['title']
+            book.author = result['author']
+            book.pages = len(result['pages'])
+            book.words = sum(words for _, words in result['pages'])
+            # Pages of the blob paginated before are never written again.
+            if not BookBlob.objects.all().filter(pk=book.blob_id_id, pages__isnull=False).exists():
+                result['book_pages'] = build_pages(book, result['pages'])
+                # Words are located without parsing the book again.
+                rsvp.save(default_storage.path(name), result['rsvp'])
+
+        self._write(batch)
+
+    @transaction.atomic
+    def _write(self, batch: list):
+        """Reference the blobs and insert the books with the pages of the new blobs"""
+        edited = timezone.now()
+        for book, path, result in batch:
+            with self._file(path, result) as file:
+                book.blob_id = blobs.acquire(file, result['title'], result['author'])
+
+            book.file = book.blob_id.file.name
+            # bulk_create doesn't call save()
+            book.edited = edited
+
+        # Duplicates of ('title', 'author', 'vk_id') are ignored without aborting the batch.
+        Book.objects.bulk_create([book for book, _, _ in batch], ignore_conflicts=True)
+        unique_ids = [book.unique_id for book, _, _ in batch]
+        inserted = dict(Book.objects.all().filter(unique_id__in=unique_ids).values_list('unique_id', 'pk'))
+
+        pages = []
+        for book, _, result in batch:
+            if book.unique_id not in inserted:
+                self.duplicates += 1
+                # The file is removed along with the last reference.
+                blobs.release(book.blob_id_id)
+                continue
+
+            book.pk = inserted[book.unique_id]
+            self.imported += 1
+            self.size += result['size']
+            # Pages of the blob are saved by the first of its books only.
+            if not BookBlob.objects.all().filter(pk=book.blob_id_id, pages__isnull=True).update(
+                    pages=book.pages, words=book.words):
+                continue
+
+            pages.extend(result.get('book_pages') or build_pages(book, result['pages']))
+
+        BookPage.objects.bulk_create(pages, batch_size=1000)
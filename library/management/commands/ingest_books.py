@@ -0,0 +1,30 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from library.ingest import ingest_pending
+
+
+class Command(BaseCommand):
+    help = 'Parse and paginate uploaded books waiting in the queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'LIBRARY_INGEST_WORKERS', None),
+                            help='Amount of parsing processes, 0 parses in the current process')
+        parser.add_argument('--batch', type=int, default=64,
+                            help='Max amount of books taken from the queue at once')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit as soon as the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = ingest_pending(options['workers'], options['batch'])
+            if processed:
+                self.stdout.write(f'Processed {processed} books')
+                continue
+
+            if options['once']:
+                return
+
+            time.sleep(options['interval'])
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Sum
+)
+from library.models import (
+    Statistics,
+    UserProgress
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild running sums of the user reading progress from the statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vk-id', type=int, help='Rebuild progress of the single user')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        progress = UserProgress.objects.all()
+        stats = Statistics.objects.all()
+        if options['vk_id']:
+            progress = progress.filter(pk=options['vk_id'])
+            stats = stats.filter(book_id__vk_id=options['vk_id'])
+
+        progress.delete()
+        sums = stats.values('book_id__vk_id').annotate(
+            books=Count('pk'),
+            **{field: Sum(field) for field in Statistics.PROGRESS_FIELDS}
+        ).order_by()
+
+        UserProgress.objects.bulk_create(
+            UserProgress(vk_id_id=row.pop('book_id__vk_id'), **row) for row in sums
+        )
+        self.stdout.write(f'Rebuilt progress of {len(sums)} users')
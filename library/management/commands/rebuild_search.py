@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from library import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild full-text search index of the book pages'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        indexed = search.rebuild()
+        self.stdout.write(f'Indexed {indexed} pages')
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from library.rollup import rollup_events
+
+
+class Command(BaseCommand):
+    help = 'Compact reading events into the daily summaries and recompute statistics of the books'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch', type=int, default=10000,
+                            help='Max amount of events compacted in a single transaction')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds to wait when there are no events')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit as soon as all the events are compacted')
+
+    def handle(self, *args, **options):
+        while True:
+            compacted = rollup_events(options['batch'])
+            if compacted:
+                self.stdout.write(f'Compacted {compacted} events')
+                continue
+
+            if options['once']:
+                return
+
+            time.sleep(options['interval'])
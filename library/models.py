@@ -1,6 +1,13 @@
+import os
 import uuid
-from django.db import models
+from datetime import timedelta
+from django.db import (
+    models,
+    transaction
+)
+from django.db.models import F
 from django.utils import timezone
+from library import sidecar
 from users.models import User
 
 
@@ -13,9 +20,42 @@ def upload_to(instance, filename) -> str:
     return f'books/{str(instance)}-{filename}'
 
 
+def blob_upload_to(instance, filename) -> str:
+    """Blobs are stored under their content hash, fanned out by its first byte"""
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256}{os.path.splitext(filename)[1]}'
+
+
+class BookBlob(models.Model):
+    """
+    Describes book file stored once for all the users uploaded it
+
+    Pages and META data are derived from the file once and shared by its books.
+    Deleted along with the file when no book references it anymore.
+    """
+
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    file = models.FileField(upload_to=blob_upload_to)
+    size = models.BigIntegerField()
+    references = models.IntegerField(default=0)
+    title = models.CharField(max_length=256)
+    author = models.CharField(max_length=256)
+    # Unknown until the file is paginated
+    pages = models.IntegerField(null=True)
+    words = models.IntegerField(null=True)
+
+    def __str__(self):
+        return f'{self.sha256}'
+
+
 class Book(models.Model):
     """Describes Book in our DB"""
 
+    class State(models.TextChoices):
+        PENDING = 'pending'
+        PROCESSING = 'processing'
+        READY = 'ready'
+        FAILED = 'failed'
+
     vk_id = models.ForeignKey(User, related_name='books_id', on_delete=models.CASCADE)
     unique_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     title = models.CharField(max_length=256)
@@ -23,6 +63,11 @@ class Book(models.Model):
     pages = models.IntegerField()
     words = models.IntegerField()
     file = models.FileField(upload_to=upload_to)
+    # Books uploaded before the blob storage have files of their own
+    blob_id = models.ForeignKey(BookBlob, related_name='books', null=True, blank=True, on_delete=models.PROTECT)
+    state = models.CharField(max_length=16, choices=State.choices, default=State.READY)
+    # When the book was taken from the queue by a worker
+    claimed = models.DateTimeField(null=True, blank=True)
     edited = models.DateTimeField()
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
@@ -30,12 +75,25 @@ class Book(models.Model):
         self.edited = timezone.now()
         return super().save()
 
+    def content_owner(self) -> dict:
+        """Pages of the books with the same file are stored once, by the blob"""
+        if self.blob_id_id:
+            return {'blob_id_id': self.blob_id_id}
+
+        return {'book_id_id': self.pk}
+
     def __str__(self):
         return f'{self.unique_id}'
 
     class Meta:
         ordering = ['edited']
         unique_together = ('title', 'author', 'vk_id')
+        indexes = [
+            # Library of the user, paginated by the cursor over edited and id
+            models.Index(fields=['vk_id', 'edited', 'id'], name='library_book_vk_id_edited_id'),
+            # Queue of the books waiting for ingestion
+            models.Index(fields=['state', 'edited'], name='library_book_state_edited'),
+        ]
 
 
 class Statistics(models.Model):
@@ -48,8 +106,13 @@ class Statistics(models.Model):
     average_speed = models.FloatField(max_length=6)
     edited = models.DateTimeField()
 
+    # Fields averaged in the user progress
+    PROGRESS_FIELDS = ('percentage', 'pages_read', 'words_read', 'average_speed')
+
+    @transaction.atomic
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         # To make sure to remember time of every update.
+        # Atomic, so the user progress is updated along with the statistics by the signals.
         self.edited = timezone.now()
         return super().save()
 
@@ -58,3 +121,115 @@ class Statistics(models.Model):
 
     class Meta:
         ordering = ['edited']
+
+
+class BookPage(models.Model):
+    """Describes pre-paginated page of the Book, or of all the books of the blob"""
+
+    book_id = models.ForeignKey(Book, related_name='book_pages', null=True, on_delete=models.CASCADE)
+    blob_id = models.ForeignKey(BookBlob, related_name='book_pages', null=True, on_delete=models.CASCADE)
+    number = models.IntegerField()
+    # Text compressed by `library.sidecar.pack_page`, the file is the only copy of the book stored as is.
+    data = models.BinaryField()
+    words = models.IntegerField()
+
+    def __str__(self):
+        return f'{self.book_id or self.blob_id} - {self.number}'
+
+    @property
+    def text(self) -> str:
+        return sidecar.unpack_page(self.data)
+
+    class Meta:
+        ordering = ['number']
+        unique_together = (('book_id', 'number'), ('blob_id', 'number'))
+
+
+class ReadingEvent(models.Model):
+    """
+    Describes span of the Book reading sent by the client
+
+    Append-only, compacted into ReadingDay by `manage.py rollup_reading`.
+    """
+
+    book_id = models.ForeignKey(Book, related_name='reading_events', on_delete=models.CASCADE)
+    # Offset of the word reached by the end of the span
+    word = models.IntegerField()
+    # Amount of words read during the span
+    words = models.IntegerField()
+    started = models.DateTimeField()
+    # Seconds
+    duration = models.FloatField()
+
+    def __str__(self):
+        return f'{self.book_id} - {self.started}'
+
+
+class ReadingDay(models.Model):
+    """Describes reading of the Book during a single day, summed up from ReadingEvent"""
+
+    book_id = models.ForeignKey(Book, related_name='reading_days', on_delete=models.CASCADE)
+    day = models.DateField()
+    events = models.IntegerField(default=0)
+    words = models.BigIntegerField(default=0)
+    seconds = models.FloatField(default=0)
+    last_word = models.IntegerField(default=0)
+
+    @classmethod
+    def speed(cls, vk_id, days: int) -> dict:
+        """Words per minute of the user over the last days"""
+        since = timezone.now().date() - timedelta(days=days)
+        total = cls.objects.all().filter(book_id__vk_id=vk_id, day__gt=since).aggregate(
+            words=models.Sum('words'), seconds=models.Sum('seconds')
+        )
+        words, seconds = total['words'] or 0, total['seconds'] or 0
+        return {
+            'days': days,
+            'words': words,
+            'seconds': seconds,
+            'average_speed': words / seconds * 60 if seconds else None,
+        }
+
+    def __str__(self):
+        return f'{self.book_id} - {self.day}'
+
+    class Meta:
+        ordering = ['day']
+        unique_together = ('book_id', 'day')
+
+
+class UserProgress(models.Model):
+    """
+    Describes running sums of the user reading Statistics
+
+    Maintained by the signals on every change of Statistics,
+    so the average progress of the user is a single primary key read.
+    """
+
+    vk_id = models.OneToOneField(User, related_name='progress', on_delete=models.CASCADE, primary_key=True)
+    books = models.IntegerField(default=0)
+    percentage = models.FloatField(default=0)
+    pages_read = models.BigIntegerField(default=0)
+    words_read = models.BigIntegerField(default=0)
+    average_speed = models.FloatField(default=0)
+
+    @classmethod
+    def add(cls, vk_id, books: int, **sums):
+        """Add amount of books and the sums of Statistics fields to the user progress"""
+        updated = cls.objects.all().filter(pk=vk_id).update(
+            books=F('books') + books,
+            **{field: F(field) + value for field, value in sums.items()}
+        )
+        # Progress of the user being deleted isn't created again.
+        if not updated and books > 0:
+            cls.objects.create(vk_id_id=vk_id, books=books, **sums)
+
+    def averages(self) -> dict:
+        """Average of every field, None if the user has no statistics"""
+        return {
+            field: getattr(self, field) / self.books if self.books else None
+            for field in Statistics.PROGRESS_FIELDS
+        }
+
+    def __str__(self):
+        return f'{self.vk_id} - {self.books}'
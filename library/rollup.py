@@ -0,0 +1,96 @@
+"""
+Compaction of the raw reading events into the daily summaries.
+
+Events are appended by the clients on every reading tick. They are summed up into ReadingDay
+in batches of the oldest events and deleted, so the reading history stays a row per book per day
+and the reading speed in Statistics of the touched books is recomputed from it.
+Position in the book is owned by the client, it's only derived from the events for the books without Statistics.
+"""
+from django.db import transaction
+from django.db.models import (
+    Count,
+    Max,
+    Sum
+)
+from django.db.models.functions import TruncDate
+from library.models import (
+    Book,
+    ReadingDay,
+    ReadingEvent,
+    Statistics
+)
+
+
+@transaction.atomic
+def rollup_events(limit: int = 10000) -> int:
+    """Compact the oldest events, returns amount of events compacted"""
+    last = ReadingEvent.objects.all().order_by('pk').values_list('pk', flat=True)[limit - 1:limit].first()
+    if last is None:
+        last = ReadingEvent.objects.all().order_by('-pk').values_list('pk', flat=True).first()
+    if last is None:
+        return 0
+
+    events = ReadingEvent.objects.all().filter(pk__lte=last)
+    rows = events.values('book_id', day=TruncDate('started')).annotate(
+        events=Count('pk'),
+        words=Sum('words'),
+        seconds=Sum('duration'),
+        last_word=Max('word'),
+    ).order_by()
+
+    rows = {(row.pop('book_id'), row.pop('day')): row for row in rows}
+    book_ids = {book_id for book_id, _ in rows}
+    existing = {
+        (day.book_id_id, day.day): day
+        for day in ReadingDay.objects.all().filter(book_id__in=book_ids, day__in={day for _, day in rows})
+    }
+
+    created, updated = [], []
+    for (book_id, day), row in rows.items():
+        summary = existing.get((book_id, day))
+        if summary is None:
+            created.append(ReadingDay(book_id_id=book_id, day=day, **row))
+            continue
+
+        summary.events += row['events']
+        summary.words += row['words']
+        summary.seconds += row['seconds']
+        summary.last_word = max(summary.last_word, row['last_word'])
+        updated.append(summary)
+
+    ReadingDay.objects.bulk_create(created)
+    ReadingDay.objects.bulk_update(updated, ['events', 'words', 'seconds', 'last_word'])
+    compacted, _ = events.delete()
+
+    recompute_statistics(book_ids)
+    return compacted
+
+
+def recompute_statistics(book_ids):
+    """
+    Recompute the reading speed in Statistics of the books from the sums of their reading days
+
+    Progress sent by the client may be newer than the events, so it's never overwritten.
+    """
+    books = Book.objects.all().in_bulk(book_ids)
+    statistics = Statistics.objects.all().in_bulk(book_ids)
+    sums = ReadingDay.objects.all().filter(book_id__in=book_ids).values('book_id').annotate(
+        words=Sum('words'),
+        seconds=Sum('seconds'),
+        last_word=Max('last_word'),
+    ).order_by()
+
+    for row in sums:
+        book = books[row['book_id']]
+        stat = statistics.get(row['book_id'])
+        if stat is None:
+            stat = Statistics(
+                book_id=book,
+                percentage=100 * row['last_word'] / book.words if book.words else 0,
+                pages_read=row['last_word'] * book.pages // book.words if book.words else 0,
+                words_read=row['last_word'],
+            )
+
+        stat.average_speed = row['words'] / row['seconds'] * 60 if row['seconds'] else 0
+        # Saved one by one, so the signals keep the user progress in sync.
+        stat.save()
@@ -0,0 +1,242 @@
+"""
+Word stream of the book for RSVP reading, one word at a time.
+
+Optimal recognition point and delay of every word are computed once, when the book is ingested or imported,
+and written next to the book file as flat arrays:
+    header
+    pages + 1 offsets of the first word of every page, uint32
+    words offsets of the first character of every word in the text of the pages joined by spaces, uint32
+    words optimal recognition points, uint8
+    words delays in tenths of the base delay, uint8
+Words themselves are read from the pages, so the text isn't stored twice.
+Character offsets are the word boundaries the book is paginated to any page size by, without parsing it again.
+"""
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+from library.services import (
+    WORDS_PER_PAGE,
+    BookParser
+)
+from library.sidecar import temporary_file
+
+SUFFIX = '.rsvp'
+# Bump it on every change of the file layout or of the computation.
+FORMAT_VERSION = 2
+
+_MAGIC = b'SPRV'
+# magic, format version, normalization version, words per page, pages, words, characters
+_HEADER = struct.Struct('<4sHHIIII')
+# Paginations of the most requested page sizes
+PAGINATIONS_CACHED = 64
+
+SENTENCE_END = '.!?…'
+CLAUSE_END = ',;:—–)'
+# Delays are stored in tenths, so 10 is the base delay of the reader
+BASE_DELAY = 10
+
+
+class WordIndexError(Exception):
+    """Word index is missing or stale"""
+
+
+def orp(word: str) -> int:
+    """Index of the letter the eye is fixed on, it's a bit left of the middle of the word"""
+    length = len(word.rstrip(SENTENCE_END + CLAUSE_END + '"\''))
+    if length <= 1:
+        return 0
+    if length <= 5:
+        return 1
+    if length <= 9:
+        return 2
+    if length <= 13:
+        return 3
+
+    return 4
+
+
+def delay(word: str) -> int:
+    """Delay of the word in tenths of the base delay, longer after punctuation and on long words"""
+    value = BASE_DELAY
+    stripped = word.rstrip('"\'')
+    if stripped.endswith(tuple(SENTENCE_END)):
+        value = BASE_DELAY * 5 // 2
+    elif stripped.endswith(tuple(CLAUSE_END)):
+        value = BASE_DELAY * 3 // 2
+
+    if len(word) > 12:
+        value += 5
+    elif len(word) > 8:
+        value += 3
+
+    return min(value, 255)
+
+
+def page_words(text: str) -> list:
+    """Words of the page the same way they are counted by the parser"""
+    return text.split(' ')
+
+
+def build(book: BookParser) -> bytes:
+    """Word index of the paginated book, built apart from writing it, so it's built by the worker parsed the book"""
+    starts, offsets, orps, delays = array('I', [0]), array('I'), array('B'), array('B')
+    position = 0
+    for text, words in book:
+        for word in page_words(text):
+            offsets.append(position)
+            orps.append(orp(word))
+            delays.append(delay(word))
+            position += len(word) + 1
+        starts.append(len(orps))
+
+    # The file is always little-endian
+    if sys.byteorder == 'big':
+        starts.byteswap()
+        offsets.byteswap()
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, book.NORMALIZATION_VERSION, book._words_per_page,
+                          len(starts) - 1, len(orps), max(position - 1, 0))
+    return header + b''.join(values.tobytes() for values in (starts, offsets, orps, delays))
+
+
+def save(path: str, data: bytes):
+    """Write the word index built by `build` next to the book file"""
+    file, temporary = temporary_file(path + SUFFIX)
+    try:
+        with file:
+            file.write(data)
+    except BaseException:
+        os.remove(temporary)
+        raise
+
+    os.replace(temporary, path + SUFFIX)
+
+
+def write(path: str, book: BookParser):
+    """Write the word index of the paginated book next to its file"""
+    save(path, build(book))
+
+
+def remove(path: str):
+    try:
+        os.remove(path + SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def open_index(path: str, book_loader, words_per_page: int = WORDS_PER_PAGE) -> 'WordIndex':
+    """Open the word index, build it from the book returned by the loader if it's missing or stale"""
+    try:
+        return WordIndex(path, words_per_page)
+    except WordIndexError:
+        write(path, book_loader())
+
+    return WordIndex(path, words_per_page)
+
+
+@lru_cache(maxsize=PAGINATIONS_CACHED)
+def _paginate(path: str, stamp: float, index_words_per_page: int, words_per_page: int) -> array:
+    """Pagination of the index as of its modification time"""
+    return WordIndex(path, index_words_per_page).split(words_per_page)
+
+
+class WordIndex:
+    """Word index of the book, only the page offsets are loaded to the memory"""
+
+    def __init__(self, path: str, words_per_page: int = WORDS_PER_PAGE):
+        self.path, self.words_per_page = path, words_per_page
+        index_path = path + SUFFIX
+        try:
+            self._stamp = os.path.getmtime(index_path)
+            if self._stamp < os.path.getmtime(path):
+                raise WordIndexError(f'{index_path} is older than the book')
+
+            with open(index_path, 'rb') as file:
+                self._data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as error:
+            raise WordIndexError(error) from error
+
+        if len(self._data) < _HEADER.size:
+            raise WordIndexError(f'{index_path} is truncated')
+
+        magic, version, normalization, index_words_per_page, self.pages, self.words, self.chars = \
+            _HEADER.unpack_from(self._data)
+        if (magic, version, normalization, index_words_per_page) != \
+                (_MAGIC, FORMAT_VERSION, BookParser.NORMALIZATION_VERSION, words_per_page):
+            raise WordIndexError(f'{index_path} is stale')
+
+        starts_end = _HEADER.size + (self.pages + 1) * 4
+        offsets_end = starts_end + self.words * 4
+        if len(self._data) < offsets_end + 2 * self.words:
+            raise WordIndexError(f'{index_path} is truncated')
+
+        self.starts = array('I')
+        self.starts.frombytes(self._data[_HEADER.size:starts_end])
+        if sys.byteorder == 'big':
+            self.starts.byteswap()
+        self._offsets = starts_end, offsets_end
+        self._orps, self._delays = offsets_end, offsets_end + self.words
+
+    def locate(self, word: int, words_per_page: int = None) -> (int, int):
+        """
+        Page of the word and offset of the word on the page, word and page are counted from 0 and 1
+
+        Pages are of the size of the index unless another size is given.
+        """
+        starts = self.paginate(words_per_page)
+        page = bisect.bisect_right(starts, word)
+        return page, word - starts[page - 1]
+
+    def word(self, page: int, offset: int = 0, words_per_page: int = None) -> int:
+        """Word at the offset on the page, reverse of locate"""
+        return self.paginate(words_per_page)[page - 1] + offset
+
+    def paginate(self, words_per_page: int = None) -> array:
+        """First word of every page of the size followed by the amount of words, memoized"""
+        if not words_per_page or words_per_page == self.words_per_page:
+            return self.starts
+
+        return _paginate(self.path, self._stamp, self.words_per_page, words_per_page)
+
+    def split(self, words_per_page: int) -> array:
+        """
+        First word of every page of the size followed by the amount of words
+
+        Page ends with the first space after the max chars the same way the parser paginates the text,
+        the space is found by bisection of the word offsets, so the text isn't read.
+        """
+        chars_per_page = words_per_page * BookParser._AVERAGE_WORD_LENGTH
+        start, end = self._offsets
+        offsets = memoryview(self._data)[start:end]
+        if sys.byteorder == 'big':
+            offsets = array('I', offsets.tobytes())
+            offsets.byteswap()
+        else:
+            offsets = offsets.cast('I')
+
+        starts, position = array('I', [0]), 0
+        while self.chars - position > chars_per_page:
+            # The next page starts with the first word after the space
+            word = bisect.bisect_left(offsets, position + chars_per_page + 1)
+            if word == self.words:
+                break
+
+            starts.append(word)
+            position = offsets[word]
+
+        starts.append(self.words)
+        return starts
+
+    def orps(self, first: int, last: int) -> list:
+        """Optimal recognition points of the words from first to last, not including it"""
+        return list(self._data[self._orps + first:self._orps + last])
+
+    def delays(self, first: int, last: int) -> list:
+        """Delay multipliers of the words from first to last, not including it"""
+        return [value / BASE_DELAY for value in self._data[self._delays + first:self._delays + last]]
+
+    def __len__(self):
+        return self.words
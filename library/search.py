@@ -0,0 +1,162 @@
+"""
+Full-text search over the page text with an SQLite FTS5 index.
+
+The index is external-content: it keeps only the tokens, the text is read from the page store
+through a view decompressing the pages, and triggers on the page store keep the index in sync.
+Pages of the blob are shared by the books of the same file, so a popular book is indexed once
+however many users uploaded it.
+
+The view and the triggers call a Python function, registered on every connection Django opens.
+Pages written by any other client, the sqlite3 shell or a restore script, fail with "no such function":
+drop the triggers before such writes, `manage.py rebuild_search` creates them again and reindexes the pages.
+"""
+import json
+from django.db import connection
+from django.db.models import (
+    Max,
+    Min,
+    Q
+)
+from library import sidecar
+from library.models import (
+    Book,
+    BookPage
+)
+
+TABLE = 'library_search'
+# Text of the pages read by the index
+VIEW = 'library_search_pages'
+# SQL function decompressing the page, registered on every connection
+PAGE_TEXT = 'library_page_text'
+# Highlight of the matched words in the snippet
+HIGHLIGHT = ('<b>', '</b>')
+SNIPPET_WORDS = 16
+
+_PAGES = BookPage._meta.db_table
+_TRIGGERS = {
+    'insert': f'AFTER INSERT ON {_PAGES} BEGIN '
+              f'INSERT INTO {TABLE} (rowid, text) VALUES (new.id, {PAGE_TEXT}(new.data)); END',
+    'delete': f'AFTER DELETE ON {_PAGES} BEGIN '
+              f"INSERT INTO {TABLE} ({TABLE}, rowid, text) VALUES ('delete', old.id, {PAGE_TEXT}(old.data)); END",
+    'update': f'AFTER UPDATE OF data ON {_PAGES} BEGIN '
+              f"INSERT INTO {TABLE} ({TABLE}, rowid, text) VALUES ('delete', old.id, {PAGE_TEXT}(old.data)); "
+              f'INSERT INTO {TABLE} (rowid, text) VALUES (new.id, {PAGE_TEXT}(new.data)); END',
+}
+
+
+def is_supported() -> bool:
+    return connection.vendor == 'sqlite'
+
+
+def register_functions(db_connection):
+    """Functions the view and the triggers call, SQLite keeps them per connection"""
+    if db_connection.vendor == 'sqlite':
+        db_connection.connection.create_function(PAGE_TEXT, 1, sidecar.unpack_page, deterministic=True)
+
+
+def create_index():
+    """
+    Create the index with its view and triggers if there is none, the database has no migrations to do it
+
+    The pages stored before the index are indexed along with its creation.
+    """
+    if not is_supported():
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = %s", [TABLE])
+        existing = cursor.fetchone()
+        # The index of older versions kept a copy of the text of its own.
+        if existing and 'content=' not in existing[0]:
+            cursor.execute(f'DROP TABLE {TABLE}')
+            existing = None
+
+        cursor.execute(f'CREATE VIEW IF NOT EXISTS {VIEW} AS SELECT id, {PAGE_TEXT}(data) AS text FROM {_PAGES}')
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(text, content='{VIEW}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        for name, trigger in _TRIGGERS.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {TABLE}_{name} {trigger}')
+
+        if not existing:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+
+
+def owner_key(book: Book) -> str:
+    """Key of the pages of the book in the page store"""
+    return book.blob_id_id or f'book:{book.pk}'
+
+
+def search(vk_id, query: str, limit: int = 20) -> list:
+    """
+    Pages of the user books containing the phrase, the most relevant first
+
+    Returns book, page, snippet with the phrase highlighted and rank.
+    """
+    if not is_supported() or not query.strip():
+        return []
+
+    books = {
+        owner_key(book): book
+        for book in Book.objects.all().filter(vk_id=vk_id, state=Book.State.READY).only('unique_id', 'title', 'blob_id')
+    }
+    if not books:
+        return []
+
+    blob_ids = [book.blob_id_id for book in books.values() if book.blob_id_id]
+    book_ids = [book.pk for book in books.values() if not book.blob_id_id]
+    # The query is a phrase, so FTS5 syntax typed by the user is never interpreted.
+    phrase = '"' + query.replace('"', '""') + '"'
+    rows = []
+    with connection.cursor() as cursor:
+        # FTS5 seeks to the range of rowids, but filters a list of them by scanning the whole index,
+        # so the spans of the user pages are searched one by one and the best pages of them are merged.
+        # The page store filters the pages of the other users sharing the spans.
+        for first, last in _spans(blob_ids, book_ids):
+            cursor.execute(
+                f'SELECT page.blob_id_id, page.book_id_id, page.number, snippet({TABLE}, 0, %s, %s, %s, %s), rank '
+                f'FROM {TABLE} JOIN {_PAGES} AS page ON page.id = {TABLE}.rowid '
+                f'WHERE {TABLE} MATCH %s AND {TABLE}.rowid BETWEEN %s AND %s '
+                f'AND (page.blob_id_id IN (SELECT value FROM json_each(%s)) '
+                f'OR page.book_id_id IN (SELECT value FROM json_each(%s))) '
+                f'ORDER BY rank LIMIT %s',
+                [*HIGHLIGHT, '…', SNIPPET_WORDS, phrase, first, last, json.dumps(blob_ids), json.dumps(book_ids),
+                 limit]
+            )
+            rows.extend(cursor.fetchall())
+
+    rows.sort(key=lambda row: row[-1])
+    return [
+        {'book': books[blob_id or f'book:{book_id}'], 'page': page, 'snippet': snippet, 'rank': rank}
+        for blob_id, book_id, page, snippet, rank in rows[:limit]
+    ]
+
+
+def _spans(blob_ids: list, book_ids: list) -> list:
+    """Ranges of ids of the pages of the blobs and the books, the pages of each are inserted together"""
+    ranges = BookPage.objects.all().filter(Q(blob_id__in=blob_ids) | Q(book_id__in=book_ids)).order_by().values(
+        'blob_id', 'book_id'
+    ).annotate(first=Min('id'), last=Max('id')).values_list('first', 'last')
+
+    spans = []
+    for first, last in sorted(ranges):
+        # Adjacent ranges are searched at once.
+        if spans and first <= spans[-1][1] + 1:
+            spans[-1][1] = max(spans[-1][1], last)
+        else:
+            spans.append([first, last])
+
+    return spans
+
+
+def rebuild() -> int:
+    """Index the pages of all the books from scratch, returns amount of indexed pages"""
+    if not is_supported():
+        return 0
+
+    create_index()
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('rebuild')")
+
+    return BookPage.objects.all().count()
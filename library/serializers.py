@@ -1,19 +1,52 @@
 import os.path
-from django.db.models import (
-    Avg,
-    Q
-)
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
 from rest_framework import serializers
 from library.models import (
     Book,
-    Statistics
+    BookPage,
+    ReadingDay,
+    ReadingEvent,
+    Statistics,
+    UserProgress
+)
+from library import (
+    blobs,
+    rsvp
+)
+from library.cache import parsed_books
+from library.services import (
+    WORDS_PER_PAGE,
+    EpubParser
 )
-from library.services import EpubParser
 
 
 EPUB_EXTENSION = 'application/epub+zip'
 
 
+def parsed_book(book: Book):
+    """Book opened from its sidecar, shared by all the books of the same blob"""
+    if book.blob_id_id:
+        # Content of the blob never changes, it's stale only if the file is written again.
+        return parsed_books.get(book.blob_id_id, book.file.path, None)
+
+    return parsed_books.get(book.unique_id, book.file.path, book.edited)
+
+
+def word_index(book: Book) -> rsvp.WordIndex:
+    """Word offsets of the book pages, the index is built from the book if it's missing or stale"""
+    return rsvp.open_index(book.file.path, lambda: parsed_book(book))
+
+
+def locate_word(book: Book, word: int, words_per_page: int = WORDS_PER_PAGE) -> (int, int):
+    """Page of the word counted from the start of the book and offset of the word on the page"""
+    if not book.file:
+        return 1, 0
+
+    return word_index(book).locate(word, words_per_page)
+
+
 class BookViewSerializer(serializers.ModelSerializer):
     """
     Serializer for EPUB-Books representation from ORM
@@ -39,14 +72,97 @@ class BookViewSerializer(serializers.ModelSerializer):
         if not data.file:
             return text, page, pages, words
 
-        _, extension = self._extension(data.file.path)
         page = int(self.context['page'])
+        # Pages may be read beforehand, so the serialization doesn't touch the database or the file.
+        book_pages = self.context.get('book_pages')
+        book_pages = iter(book_pages) if book_pages is not None else self.get_book_pages(data, page, page)
+        return next(book_pages, (text, page, data.pages, words))
+
+    def get_book_pages(self, data, first: int, last: int):
+        """Yield text, page, pages, words of every existing page in the range"""
+        if not data.file:
+            return
+
+        words_per_page = self.context.get('words_per_page', WORDS_PER_PAGE)
+        if words_per_page != WORDS_PER_PAGE:
+            index, starts = self.get_pagination(data, words_per_page)
+            book_pages = BookViewSerializer().get_book_pages(data, *self.covering_pages(index, starts, first, last))
+            yield from self.repaginate(index, starts, first, last, book_pages)
+            return
+
+        book_pages = self.get_stored_pages(data, first, last)
+        if book_pages is None:
+            book_pages = self.parse_pages(data, first, last)
+
+        yield from book_pages
+
+    def get_stored_pages(self, data, first: int, last: int) -> list:
+        """Pages of the range stored in the database, queries the database only, None if the pages have to be parsed"""
+        # Pages are paginated once during the upload, so the whole range is a single indexed lookup.
+        owner = data.content_owner()
+        book_pages = [
+            (book_page.text, book_page.number, data.pages, book_page.words)
+            for book_page in BookPage.objects.all().filter(**owner, number__range=(first, last)).only(
+                'number', 'data', 'words'
+            )
+        ]
+        if book_pages or BookPage.objects.all().filter(**owner).exists():
+            return book_pages
+
+        return None
+
+    def parse_pages(self, data, first: int, last: int):
+        """Yield text, page, pages, words of the pages parsed from the file, doesn't query the database"""
+        # Books uploaded before the page store existed have to be parsed.
+        _, extension = self._extension(data.file.path)
         if extension == '.epub':
-            book = EpubParser(data.file.path)
-            text, words = book.get_page(page)
-            pages = len(book)
+            book = parsed_book(data)
+            for page in range(max(first, 1), min(last, len(book)) + 1):
+                text, words = book.get_page(page)
+                yield text, page, len(book), words
+
+    def get_pagination(self, data, words_per_page: int) -> (rsvp.WordIndex, list):
+        """Word index of the book and first word of every page of the size, reads the word index only"""
+        index = word_index(data)
+        return index, index.paginate(words_per_page)
+
+    def covering_pages(self, index: rsvp.WordIndex, starts, first: int, last: int) -> (int, int):
+        """Range of the stored pages containing the words of the pages of another size from first to last"""
+        first, last = max(first, 1), min(last, len(starts) - 1)
+        if first > last:
+            return 1, 0
+
+        return index.locate(starts[first - 1])[0], index.locate(starts[last] - 1)[0]
+
+    def repaginate(self, index: rsvp.WordIndex, starts, first: int, last: int, book_pages):
+        """
+        Yield text, page, pages, words of the pages of another size cut out of the stored pages covering them
 
-        return text, page, pages, words
+        Words are counted from the start of the book, so they are the same whatever the size of the pages.
+        """
+        pages = len(starts) - 1
+        first, last = max(first, 1), min(last, pages)
+        if first > last:
+            return
+
+        tokens = []
+        for text, *_ in book_pages:
+            tokens.extend(rsvp.page_words(text))
+
+        # Word the tokens start with
+        base = starts[first - 1] - index.locate(starts[first - 1])[1]
+        for page in range(first, last + 1):
+            words = tokens[starts[page - 1] - base:starts[page] - base]
+            yield ' '.join(words), page, pages, len(words)
+
+    def iter_representation(self, instance, first: int, last: int, book_pages=None):
+        """Representation of every page in the range, one by one"""
+        if book_pages is None:
+            book_pages = self.get_book_pages(instance, first, last)
+
+        for text, page, pages, words in book_pages:
+            instance.text, instance.page, instance.pages, instance.words = text, page, pages, words
+            yield super().to_representation(instance)
 
     def _extension(self, file_name):
         return os.path.splitext(file_name)
@@ -64,6 +180,65 @@ class BookViewSerializer(serializers.ModelSerializer):
         }
 
 
+class WordStreamSerializer(serializers.BaseSerializer):
+    """
+    Representation of the word range of the Book for RSVP reading
+
+    Words, optimal recognition points and delay multipliers are parallel arrays, so the payload is compact.
+    Points and delays are precomputed during the ingestion, words are read from the pages.
+    """
+
+    def to_representation(self, instance):
+        book, first, count = instance['book'], instance['word'], instance['count']
+        tokens, orps, delays, words = [], [], [], 0
+
+        if book.file:
+            index = word_index(book)
+            words = len(index)
+            last = min(first + count, words)
+            if first < last:
+                tokens = self.get_tokens(book, index, first, last)
+                orps, delays = index.orps(first, last), index.delays(first, last)
+
+        return {
+            'book_id': str(book.unique_id),
+            'word': first,
+            'words': words,
+            'tokens': tokens,
+            'orp': orps,
+            'delay': delays,
+        }
+
+    def get_tokens(self, book: Book, index: rsvp.WordIndex, first: int, last: int) -> list:
+        """Words from first to last, only the pages containing them are read"""
+        first_page, offset = index.locate(first)
+        last_page, _ = index.locate(last - 1)
+
+        tokens = []
+        for text, *_ in BookViewSerializer().get_book_pages(book, first_page, last_page):
+            tokens.extend(rsvp.page_words(text))
+
+        return tokens[offset:offset + last - first]
+
+
+class BookSummarySerializer(serializers.ModelSerializer):
+    """
+    Serializer for Book in the user library listing
+
+    Only Book columns and reading progress are used, the book file is never opened.
+    """
+
+    percentage = serializers.FloatField(source='statistics.percentage', read_only=True, default=None)
+    pages_read = serializers.IntegerField(source='statistics.pages_read', read_only=True, default=None)
+    words_read = serializers.IntegerField(source='statistics.words_read', read_only=True, default=None)
+
+    class Meta:
+        model = Book
+        fields = ('unique_id', 'title', 'author', 'pages', 'words', 'edited',
+                  'percentage', 'pages_read', 'words_read')
+        read_only_fields = fields
+
+
 class BookCreateSerializer(serializers.ModelSerializer):
     """
     Deserializer for user requested EPUB-book
@@ -72,6 +247,7 @@ class BookCreateSerializer(serializers.ModelSerializer):
     • title
     • author
     Set unique_id automatically.
+    Text is paginated later by the ingestion workers, until then the book is pending.
     """
 
     file = serializers.FileField(required=True, write_only=True)
@@ -85,18 +261,37 @@ class BookCreateSerializer(serializers.ModelSerializer):
             return super().to_internal_value(data)
 
         if data['file'].content_type == EPUB_EXTENSION:
-            path = data['file'].temporary_file_path()
-            book = EpubParser(path, parse_text=True)
+            # META data of the file uploaded before is known already.
+            book = blobs.find(data['file'])
+            if book is None:
+                # Only META data is parsed during the request.
+                book = EpubParser(data['file'].temporary_file_path(), parse_text=False)
             data['title'] = book.title
             data['author'] = book.author
-            data['pages'] = len(book)
-            data['words'] = book.total_words()
+            data['pages'] = 0
+            data['words'] = 0
 
         return super().to_internal_value(data)
 
+    def create(self, validated_data):
+        # The file is copied before the transaction, so the write lock isn't held meanwhile.
+        blobs.store(validated_data['file'])
+        with transaction.atomic():
+            blob = blobs.acquire(validated_data['file'], validated_data['title'], validated_data['author'])
+            validated_data['file'] = blob.file.name
+            validated_data['blob_id'] = blob
+            # File is paginated once for all the users uploaded it.
+            if blob.pages is None:
+                validated_data['state'] = Book.State.PENDING
+            else:
+                validated_data['state'] = Book.State.READY
+                validated_data['pages'], validated_data['words'] = blob.pages, blob.words
+
+            return super().create(validated_data)
+
     class Meta:
         model = Book
-        fields = ('unique_id', 'vk_id', 'file', 'title', 'author', 'pages', 'words')
+        fields = ('unique_id', 'vk_id', 'file', 'title', 'author', 'pages', 'words', 'state')
         extra_kwargs = {
             'file': {'write_only': True},
             'vk_id': {'write_only': True},
@@ -105,9 +300,18 @@ class BookCreateSerializer(serializers.ModelSerializer):
             'unique_id': {'read_only': True},
             'title': {'read_only': True},
             'author': {'read_only': True},
+            'state': {'read_only': True},
         }
 
 
+class BookStateSerializer(serializers.ModelSerializer):
+    """Serializer for ingestion state of the book"""
+
+    class Meta:
+        model = Book
+        fields = ('unique_id', 'state')
+
+
 class LibraryProgressModelSerializer(serializers.ModelSerializer):
     book_id = serializers.SlugRelatedField(slug_field='unique_id', queryset=Book.objects.all())
 
@@ -116,19 +320,136 @@ class LibraryProgressModelSerializer(serializers.ModelSerializer):
         fields = ('book_id', 'pages_read', 'words_read', 'percentage', 'average_speed')
 
 
+class LibraryProgressItemSerializer(serializers.Serializer):
+    book_id = serializers.UUIDField()
+    pages_read = serializers.IntegerField()
+    words_read = serializers.IntegerField()
+    percentage = serializers.FloatField()
+    average_speed = serializers.FloatField()
+
+
+class LibraryProgressBulkSerializer(serializers.Serializer):
+    """
+    Deserializer for a batch of the user reading progress
+
+    Every valid item is upserted with a single query per batch,
+    invalid items and books of other users are reported with their status.
+    """
+
+    vk_id = serializers.IntegerField()
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False,
+                                  max_length=getattr(settings, 'LIBRARY_MAX_PROGRESS_BATCH', 1000))
+
+    @transaction.atomic
+    def save(self, **kwargs) -> list:
+        """Upsert the statistics, return status of every item"""
+        vk_id = self.validated_data['vk_id']
+        results, valid = [], {}
+        for item in self.validated_data['items']:
+            item_serialized = LibraryProgressItemSerializer(data=item)
+            if not item_serialized.is_valid():
+                results.append({'book_id': item.get('book_id'), 'status': 'invalid', 'errors': item_serialized.errors})
+                continue
+
+            data = item_serialized.validated_data
+            results.append({'book_id': str(data['book_id']), 'status': None})
+            # The latest progress of the book wins.
+            if data['book_id'] in valid:
+                results[valid[data['book_id']][0]]['status'] = 'duplicate'
+            valid[data['book_id']] = (len(results) - 1, data)
+
+        # Ownership of all the books is checked at once.
+        books = dict(Book.objects.all().filter(vk_id=vk_id, unique_id__in=valid).values_list('unique_id', 'pk'))
+        existing = {stat.pk: stat for stat in Statistics.objects.all().filter(book_id__in=books.values())}
+
+        edited = timezone.now()
+        created, updated = [], []
+        # bulk_create and bulk_update don't send signals, so the user progress is updated here.
+        sums = dict.fromkeys(Statistics.PROGRESS_FIELDS, 0)
+        for unique_id, (index, data) in valid.items():
+            if unique_id not in books:
+                results[index]['status'] = 'not_found'
+                continue
+
+            stat = existing.get(books[unique_id])
+            if stat is None:
+                stat = Statistics(book_id_id=books[unique_id])
+                created.append(stat)
+                results[index]['status'] = 'created'
+            else:
+                updated.append(stat)
+                results[index]['status'] = 'updated'
+
+            for field in Statistics.PROGRESS_FIELDS:
+                sums[field] += data[field] - (getattr(stat, field) or 0)
+                setattr(stat, field, data[field])
+            stat.edited = edited
+
+        Statistics.objects.bulk_create(created)
+        Statistics.objects.bulk_update(updated, [*Statistics.PROGRESS_FIELDS, 'edited'])
+        if created or updated:
+            UserProgress.add(vk_id, len(created), **sums)
+
+        return results
+
+
+class ReadingEventSerializer(serializers.ModelSerializer):
+    book_id = serializers.UUIDField()
+
+    class Meta:
+        model = ReadingEvent
+        fields = ('book_id', 'word', 'words', 'started', 'duration')
+        extra_kwargs = {
+            'word': {'min_value': 0},
+            'words': {'min_value': 0},
+            'duration': {'min_value': 0},
+        }
+
+
+class ReadingEventBulkSerializer(serializers.Serializer):
+    """
+    Deserializer for a batch of the reading events
+
+    Events of the books not belonging to the user are dropped.
+    """
+
+    vk_id = serializers.IntegerField()
+    events = serializers.ListField(child=ReadingEventSerializer(), allow_empty=False,
+                                   max_length=getattr(settings, 'LIBRARY_MAX_READING_EVENTS', 1000))
+
+    def save(self, **kwargs) -> int:
+        """Append the events, return amount of them stored"""
+        events = self.validated_data['events']
+        books = dict(Book.objects.all().filter(
+            vk_id=self.validated_data['vk_id'], unique_id__in={event['book_id'] for event in events}
+        ).values_list('unique_id', 'pk'))
+
+        stored = ReadingEvent.objects.bulk_create(
+            ReadingEvent(book_id_id=books[event['book_id']], word=event['word'], words=event['words'],
+                         started=event['started'], duration=event['duration'])
+            for event in events if event['book_id'] in books
+        )
+        return len(stored)
+
+
+class ReadingSpeedBaseSerializer(serializers.BaseSerializer):
+    def to_representation(self, instance):
+        return ReadingDay.speed(instance['vk_id'], instance['days'])
+
+
+class SearchHitSerializer(serializers.Serializer):
+    """Page of the user book matching the search query"""
+
+    book_id = serializers.UUIDField(source='book.unique_id')
+    title = serializers.CharField(source='book.title')
+    page = serializers.IntegerField()
+    snippet = serializers.CharField()
+    rank = serializers.FloatField()
+
+
 class LibraryAvgProgressBaseSerializer(serializers.BaseSerializer):
     def to_representation(self, instance):
-        books = Book.objects.all().filter(vk_id=instance['vk_id']).all()
-        stat = Statistics.objects.all().filter(book_id__in=books).aggregate(
-            Avg('percentage'),
-            Avg('pages_read'),
-            Avg('words_read'),
-            Avg('average_speed')
-        )
+        # Running sums are maintained on every change of the statistics.
+        progress = UserProgress.objects.all().filter(pk=instance['vk_id']).first() or UserProgress()
 
-        return {
-            'pages_read': stat['pages_read__avg'],
-            'words_read': stat['words_read__avg'],
-            'percentage': stat['percentage__avg'],
-            'average_speed': stat['average_speed__avg'],
-        }
+        return progress.averages()
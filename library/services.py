@@ -1,7 +1,12 @@
-import re
 from ebooklib import epub
 from ebooklib.epub import EpubBook
-from bs4 import BeautifulSoup
+from library.extractors import (
+    TextExtractor,
+    get_extractor
+)
+
+# Default size of the page
+WORDS_PER_PAGE = 1024
 
 
 class BookParser:
@@ -11,10 +16,13 @@ class BookParser:
 
     author = ''
     title = ''
+    # Bump it on every change of the text normalization, so derived data is rebuilt.
+    NORMALIZATION_VERSION = 2
     _AVERAGE_WORD_LENGTH = 5
 
-    def __init__(self, parse_text=True, words_per_page: int = 1024):
+    def __init__(self, parse_text=True, words_per_page: int = WORDS_PER_PAGE):
         self._pages = []
+        self._paginator = None
         self._words_per_page = words_per_page
         self._chars_per_page = self._words_per_page * self._AVERAGE_WORD_LENGTH
 
@@ -29,11 +37,15 @@ class BookParser:
         Return an empty string if page doesn't exist.
         """
 
+        # Text is paginated lazily if it wasn't parsed during the init.
+        if page > len(self._pages):
+            self._parse_text(page)
+
         # Make it list-friendly
         page = page - 1
 
         if page not in range(0, len(self._pages)):
-            return ''
+            return '', 0
 
         return self._pages[page], self._count_words(page)
 
@@ -50,6 +62,10 @@ class BookParser:
 
         return words
 
+    def total_bytes(self) -> int:
+        """Size of the book text encoded to UTF-8"""
+        return sum(len(page.encode('utf-8')) for page in self._pages)
+
     def _count_words(self, page):
         """Count words on the given page"""
         # Assuming that there is only single space between words.
@@ -60,38 +76,52 @@ class BookParser:
         """Parse META data"""
         pass
 
-    def _parse_text(self):
-        """Parse and paginate text from ebook file"""
-        pass
-
-    def _splitter(self, text_buffer: str) -> (int, str):
+    def _parse_text(self, until: int = None):
         """
-        Paginator, recursively splits big text to chunk
-        Returns last page and unused text.
+        Parse and paginate text from ebook file.
+        Stops as soon as the given page is produced, the rest is parsed on the next call.
         """
 
-        if len(text_buffer) > self._chars_per_page:
-            # Index of the space after the max words
-            index = self._find_page_end(text_buffer)
-            # Put this text until the index in the paginator
-            self._pages.append(text_buffer[:index])
+        if self._paginator is None:
+            self._paginator = self._paginate(self._chapters())
 
-            # Check the rest
-            return self._splitter(text_buffer[index+1:])
+        for page in self._paginator:
+            self._pages.append(page)
+            if until is not None and len(self._pages) >= until:
+                return
 
-        return len(self._pages), text_buffer
+    def _chapters(self):
+        """Yield normalized text of every chapter"""
+        return iter(())
 
-    def _find_page_end(self, text: str) -> int:
+    def _paginate(self, chapters):
         """
-        Finds where the chunk of text ends with a space
-        to make a correct split without chopping out some words.
+        Paginator, lazily splits stream of the chapters into pages in one pass.
+        Page ends with the first space after the max chars, so words aren't chopped out.
+        Chapters are joined by a space, so the last word of a chapter isn't glued to the first word of the next one.
         """
 
-        for i, v in enumerate(text[self._chars_per_page:]):
-            if v == ' ':
-                return self._chars_per_page + i
+        text_buffer, paginated = '', False
+        for chapter in chapters:
+            # Only the last unfinished page is carried over to the next chapter.
+            text_buffer += ' ' + chapter if text_buffer and chapter else chapter
+            start = 0
+
+            while len(text_buffer) - start > self._chars_per_page:
+                # Index of the space after the max words
+                index = text_buffer.find(' ', start + self._chars_per_page)
+                if index == -1:
+                    index = len(text_buffer)
 
-        return len(text)
+                yield text_buffer[start:index]
+                start = index + 1
+                paginated = True
+
+            text_buffer = text_buffer[start:]
+
+        # Remains are the last page, the book ended by a full page has no empty one.
+        if text_buffer or not paginated:
+            yield text_buffer
 
     def __str__(self):
         """Returns author and title of the book"""
@@ -101,34 +131,33 @@ class BookParser:
         """Returns amount of the pages starting from 1"""
         return len(self._pages)
 
+    def __iter__(self):
+        """Iterate over text and amount of words of every page"""
+        for i in range(0, len(self._pages)):
+            yield self._pages[i], self._count_words(i)
+
 
 class EpubParser(BookParser):
     book = EpubBook
 
-    def __init__(self, path: str, parse_text=True):
+    def __init__(self, path: str, parse_text=True, words_per_page: int = WORDS_PER_PAGE,
+                 extractor: TextExtractor = None):
         self.book = epub.read_epub(path)
-        super().__init__(parse_text)
+        self._extractor = extractor or get_extractor()
+        super().__init__(parse_text, words_per_page)
 
     def _parse_meta(self):
         self.title = self.book.title
         author_meta = self.book.get_metadata('DC', 'creator')
         self.author = ', '.join(i[0] for i in author_meta)
 
-    def _parse_text(self):
-        text_buffer = ''
-
-        for item in self.book.get_items():
-            # I didn't find any other way to check item for the chapter
-            if hasattr(item, '_template_name') and item._template_name == 'chapter':
-                soup = BeautifulSoup(item.get_body_content(), 'html.parser')
-                # hey, I use regex here, so it may be a bit slow.
-                # make every new line single spaced.
-                # make multiple spaces into one.
-                text = re.sub('((\n|\s)+)', ' ', soup.get_text())
-                # remove escape sequnces.
-                text_buffer += re.sub('(\r|\t|\v)', '', text).strip()
-                page, text_buffer = self._splitter(text_buffer)
-
-        # Write remains and clear the buffer
-        self._pages.append(text_buffer)
-        del text_buffer
+    def _chapter_items(self) -> list:
+        # I didn't find any other way to check item for the chapter
+        return [
+            item for item in self.book.get_items()
+            if hasattr(item, '_template_name') and item._template_name == 'chapter'
+        ]
+
+    def _chapters(self):
+        for item in self._chapter_items():
+            yield self._extractor.extract(item.get_body_content())
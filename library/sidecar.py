@@ -0,0 +1,272 @@
+import lzma
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+from django.conf import settings
+from library.services import (
+    WORDS_PER_PAGE,
+    BookParser,
+    EpubParser
+)
+
+TEXT_SUFFIX = '.txt'
+INDEX_SUFFIX = '.idx'
+# Bump it on every change of the file layout.
+FORMAT_VERSION = 3
+
+# Text is stored in blocks of a few pages compressed independently,
+# so a page is read by decompressing its block only.
+CODECS = {
+    'none': (0, lambda data, level: data, lambda data: data),
+    'zlib': (1, lambda data, level: zlib.compress(data, level), zlib.decompress),
+    'lzma': (2, lambda data, level: lzma.compress(data, preset=level), lzma.decompress),
+}
+
+_MAGIC = b'SPRZ'
+# magic, format version, normalization version, words per page, pages, codec, level, pages per block,
+# size of the text file the index belongs to
+_HEADER = struct.Struct('<4sHHIIBBHQ')
+# start byte, end byte of the block in the text file
+_BLOCK = struct.Struct('<QQ')
+# start byte, end byte of the page in the decompressed block, words
+_RECORD = struct.Struct('<III')
+
+
+def _options(codec: str = None, level: int = None, pages_per_block: int = None) -> (str, int, int):
+    """Compression of the sidecar, configured by the settings by default"""
+    codec = codec or getattr(settings, 'LIBRARY_SIDECAR_CODEC', 'zlib')
+    if codec not in CODECS:
+        raise ValueError(f'Unknown codec {codec}, use one of {", ".join(CODECS)}')
+
+    level = getattr(settings, 'LIBRARY_SIDECAR_LEVEL', 6) if level is None else level
+    pages_per_block = pages_per_block or getattr(settings, 'LIBRARY_SIDECAR_PAGES_PER_BLOCK', 4)
+    return codec, level, pages_per_block
+
+
+class SidecarError(Exception):
+    """Sidecar is missing or stale"""
+
+
+def pack_page(text: str, codec: str = None, level: int = None) -> bytes:
+    """Compress text of the single page stored in the database, prefixed with the id of its codec"""
+    codec, level, _ = _options(codec, level)
+    codec_id, compress, _ = CODECS[codec]
+    return bytes((codec_id,)) + compress(text.encode('utf-8'), level)
+
+
+def unpack_page(data: bytes) -> str:
+    """Text of the page packed by `pack_page`, pages packed with any of the codecs are read"""
+    data = bytes(data)
+    decompress = next(decompress for codec_id, _, decompress in CODECS.values() if codec_id == data[0])
+    return decompress(data[1:]).decode('utf-8')
+
+
+def temporary_file(path: str):
+    """
+    Unique temporary file next to the path, to be renamed to it
+
+    Books are written by any worker, so concurrent writers never share a temporary file.
+    The file gets the permissions of the uploaded files rather than the owner-only ones of mkstemp.
+    """
+    directory, name = os.path.split(path)
+    descriptor, temporary = tempfile.mkstemp(prefix=name + '.', suffix='.tmp', dir=directory)
+    os.chmod(temporary, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+    return os.fdopen(descriptor, 'wb'), temporary
+
+
+def write(path: str, book: BookParser, codec: str = None, level: int = None, pages_per_block: int = None):
+    """
+    Write normalized UTF-8 text of the book next to its file in compressed blocks of pages
+    along with the index of block offsets, page offsets and word counts.
+    """
+
+    codec, level, pages_per_block = _options(codec, level, pages_per_block)
+    codec_id, compress, _ = CODECS[codec]
+    text_path, index_path = path + TEXT_SUFFIX, path + INDEX_SUFFIX
+    blocks, records = bytearray(), bytearray()
+    block, offset, pages = bytearray(), 0, 0
+
+    text_file, text_temporary = temporary_file(text_path)
+    index_file, index_temporary = temporary_file(index_path)
+    try:
+        with text_file, index_file:
+            def flush():
+                nonlocal block, offset
+                data = compress(bytes(block), level)
+                text_file.write(data)
+                blocks.extend(_BLOCK.pack(offset, offset + len(data)))
+                block, offset = bytearray(), offset + len(data)
+
+            for text, words in book:
+                data = text.encode('utf-8')
+                records += _RECORD.pack(len(block), len(block) + len(data), words)
+                block += data
+                pages += 1
+                if pages % pages_per_block == 0:
+                    flush()
+
+            if pages % pages_per_block:
+                flush()
+
+            index_file.write(_HEADER.pack(_MAGIC, FORMAT_VERSION, book.NORMALIZATION_VERSION, book._words_per_page,
+                                          pages, codec_id, level, pages_per_block, offset))
+            index_file.write(blocks)
+            index_file.write(records)
+    except BaseException:
+        for temporary in (text_temporary, index_temporary):
+            os.remove(temporary)
+        raise
+
+    # Index is replaced the last, so readers never see it along with the old text.
+    # Index of a concurrent writer may still be paired with this text, the size of the text tells it.
+    os.replace(text_temporary, text_path)
+    os.replace(index_temporary, index_path)
+
+
+def remove(path: str):
+    """Remove sidecar of the book if there is one"""
+    for suffix in (TEXT_SUFFIX, INDEX_SUFFIX):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def open_book(path: str, words_per_page: int = WORDS_PER_PAGE, **options) -> BookParser:
+    """
+    Open book from its sidecar, build the sidecar first if it's missing or stale
+
+    Options are codec, level and pages_per_block of the compression, configured by the settings by default.
+    """
+    try:
+        return MappedBook(path, words_per_page, **options)
+    except SidecarError:
+        write(path, EpubParser(path, words_per_page=words_per_page), **options)
+
+    return MappedBook(path, words_per_page, **options)
+
+
+class MappedBook(BookParser):
+    """
+    Book read page by page from its sidecar through mmap.
+
+    Nothing is parsed and only the block of the requested page is loaded to the memory.
+    The last decompressed block is kept, so the next page is usually read without decompression.
+    """
+
+    def __init__(self, path: str, words_per_page: int = WORDS_PER_PAGE,
+                 codec: str = None, level: int = None, pages_per_block: int = None):
+        self.path = path
+        self._text = self._index = None
+        self._options = _options(codec, level, pages_per_block)
+        self._block = (None, b'')
+        super().__init__(parse_text=False, words_per_page=words_per_page)
+
+    def get_page(self, page: int = 1) -> (str, int):
+        if page not in range(1, self._length + 1):
+            return '', 0
+
+        start, end, words = _RECORD.unpack_from(self._index, self._records_offset + (page - 1) * _RECORD.size)
+        number = (page - 1) // self._pages_per_block
+        # Uncompressed page is sliced right from the mapped file.
+        if not self._codec_id:
+            block_start, _ = _BLOCK.unpack_from(self._index, _HEADER.size + number * _BLOCK.size)
+            return self._text[block_start + start:block_start + end].decode('utf-8'), words
+
+        return self._read_block(number)[start:end].decode('utf-8'), words
+
+    def is_empty(self) -> bool:
+        return not self._length
+
+    def total_words(self) -> int:
+        return sum(words for _, _, words in self._records())
+
+    def total_bytes(self) -> int:
+        """Bytes of the decompressed text"""
+        return sum(end - start for start, end, _ in self._records())
+
+    def disk_bytes(self) -> int:
+        """Bytes of the sidecar files"""
+        return len(self._text) + len(self._index)
+
+    def retained_bytes(self) -> int:
+        """
+        Bytes the book may hold in the memory of the worker: the mapped index and the decompressed block
+
+        Uncompressed text is sliced right from the mapped file, so no block is kept.
+        """
+        if not self._codec_id:
+            return len(self._index)
+
+        block = 0
+        for last in range(self._pages_per_block, self._length + self._pages_per_block, self._pages_per_block):
+            # Last page of the block ends where the decompressed block does.
+            page = min(last, self._length)
+            _, end, _ = _RECORD.unpack_from(self._index, self._records_offset + (page - 1) * _RECORD.size)
+            block = max(block, end)
+
+        return len(self._index) + block
+
+    def _read_block(self, number: int) -> bytes:
+        cached, data = self._block
+        if cached == number:
+            return data
+
+        start, end = _BLOCK.unpack_from(self._index, _HEADER.size + number * _BLOCK.size)
+        data = self._decompress(self._text[start:end])
+        self._block = (number, data)
+        return data
+
+    def _records(self):
+        return _RECORD.iter_unpack(self._index[self._records_offset:])
+
+    def _parse_meta(self):
+        """Map the sidecar and check it was built with the same rules"""
+        text_path, index_path = self.path + TEXT_SUFFIX, self.path + INDEX_SUFFIX
+
+        try:
+            if os.path.getmtime(index_path) < os.path.getmtime(self.path):
+                raise SidecarError(f'{index_path} is older than the book')
+
+            self._index = self._map(index_path)
+            self._text = self._map(text_path)
+        except OSError as error:
+            raise SidecarError(error) from error
+
+        if len(self._index) < _HEADER.size:
+            raise SidecarError(f'{index_path} is truncated')
+
+        magic, version, normalization, words_per_page, self._length, self._codec_id, level, self._pages_per_block, \
+            text_bytes = _HEADER.unpack_from(self._index)
+        codec, expected_level, pages_per_block = self._options
+        # Sidecar is rebuilt on the change of the compression settings as well.
+        if (magic, version, normalization, words_per_page, self._codec_id, level, self._pages_per_block) != \
+                (_MAGIC, FORMAT_VERSION, self.NORMALIZATION_VERSION, self._words_per_page, CODECS[codec][0],
+                 expected_level, pages_per_block):
+            raise SidecarError(f'{index_path} is stale')
+
+        if len(self._text) != text_bytes:
+            raise SidecarError(f'{index_path} belongs to another {text_path}')
+
+        self._decompress = CODECS[codec][2]
+        blocks = -(-self._length // self._pages_per_block)
+        self._records_offset = _HEADER.size + blocks * _BLOCK.size
+        if len(self._index) < self._records_offset + self._length * _RECORD.size:
+            raise SidecarError(f'{index_path} is truncated')
+
+    def _map(self, path: str):
+        with open(path, 'rb') as file:
+            # Empty file can't be mapped.
+            if not os.fstat(file.fileno()).st_size:
+                return b''
+
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        for page in range(1, self._length + 1):
+            yield self.get_page(page)
+
+    def __len__(self):
+        return self._length
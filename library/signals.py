@@ -0,0 +1,67 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (
+    post_delete,
+    post_save,
+    pre_save
+)
+from django.dispatch import receiver
+from library import (
+    blobs,
+    search
+)
+from library.models import (
+    Book,
+    Statistics,
+    UserProgress
+)
+
+
+def _owner(stat: Statistics):
+    return Book.objects.all().filter(pk=stat.book_id_id).values_list('vk_id', flat=True).first()
+
+
+def _values(stat: Statistics) -> dict:
+    return {field: getattr(stat, field) for field in Statistics.PROGRESS_FIELDS}
+
+
+@receiver(pre_save, sender=Statistics)
+def remember_statistics(sender, instance: Statistics, **kwargs):
+    """Remember values being overwritten to update the user progress by the difference"""
+    instance._previous = Statistics.objects.all().filter(pk=instance.pk).values(*Statistics.PROGRESS_FIELDS).first()
+
+
+@receiver(post_save, sender=Statistics)
+def update_progress(sender, instance: Statistics, **kwargs):
+    previous = getattr(instance, '_previous', None)
+    values = _values(instance)
+    if previous is None:
+        UserProgress.add(_owner(instance), 1, **values)
+        return
+
+    UserProgress.add(_owner(instance), 0, **{field: values[field] - previous[field] for field in values})
+
+
+@receiver(post_delete, sender=Statistics)
+def remove_progress(sender, instance: Statistics, **kwargs):
+    """Called for cascades from the Book deletion as well"""
+    owner = _owner(instance)
+    if owner is not None:
+        UserProgress.add(owner, -1, **{field: -value for field, value in _values(instance).items()})
+
+
+@receiver(post_delete, sender=Book)
+def release_blob(sender, instance: Book, **kwargs):
+    """File shared with the other users is kept until the last of their books is deleted"""
+    if instance.blob_id_id:
+        blobs.release(instance.blob_id_id)
+
+
+@receiver(connection_created)
+def register_search_functions(sender, connection, **kwargs):
+    """The search index is kept in sync with the pages by the triggers calling them"""
+    search.register_functions(connection)
+
+
+def create_search_index(sender, **kwargs):
+    """Connected to post_migrate of the app, the virtual table is out of the ORM"""
+    search.create_index()
@@ -0,0 +1,44 @@
+import shutil
+import tempfile
+from django.test import (
+    Client,
+    override_settings
+)
+from django.urls import reverse
+from library.ingest import ingest_pending
+from library.models import Book
+
+EPUB = 'library/test/test_files/accessible_epub_3.epub'
+
+# Rendered pages are cached in the memory of the test run rather than in the cache directory of the project.
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f'test-{alias}'}
+    for alias in ('default', 'library')
+}
+
+
+class MediaMixin:
+    """Files saved by the tests go to a temporary MEDIA_ROOT of the test case, removed after every test"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=cls.media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.media_root, ignore_errors=True)
+        super().tearDown()
+
+
+def upload_book(vk_id, ingest: bool = True) -> Book:
+    """Upload the book of the user through the API, then ingest the pending books"""
+    with open(EPUB, 'rb') as file:
+        response = Client().post(reverse('api_library:library_list_control'), data={'vk_id': vk_id, 'file': file})
+
+    if ingest:
+        ingest_pending(workers=0)
+
+    return Book.objects.get(unique_id=response.data['unique_id'])
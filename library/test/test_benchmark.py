@@ -0,0 +1,43 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from django.core.management import (
+    CommandError,
+    call_command
+)
+from django.test import SimpleTestCase
+
+
+class TestBenchLibrary(SimpleTestCase):
+    """Testing manage.py bench_library"""
+
+    def test_bench(self):
+        """Results are written as JSON and compared with the baseline"""
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'bench.json')
+            call_command('bench_library', sizes=['short_story'], directory=directory, output=output, stdout=StringIO())
+
+            with open(output) as file:
+                results = json.load(file)
+
+            stages = results['sizes']['short_story']['stages']
+            self.assertEqual(set(stages), {'construct', 'parse_text', 'paginate', 'get_page', 'total_words'})
+            self.assertGreater(stages['parse_text']['pages_per_second'], 0)
+            self.assertGreater(stages['parse_text']['peak_bytes'], 0)
+
+            # Compression trades disk for the page read latency
+            sidecars = results['sizes']['short_story']['sidecars']
+            self.assertLess(sidecars['zlib-6x16']['disk_bytes'], sidecars['none-0x1']['disk_bytes'])
+            self.assertGreater(sidecars['zlib-6x16']['page_read_us'], 0)
+
+            # Baseline is impossibly fast
+            for stage in stages.values():
+                stage['seconds'] = 1e-12
+            with open(output, 'w') as file:
+                json.dump(results, file)
+
+            with self.assertRaises(CommandError):
+                call_command('bench_library', sizes=['short_story'], directory=directory,
+                             baseline=output, max_regression=2, stdout=StringIO())
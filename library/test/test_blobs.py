@@ -0,0 +1,169 @@
+import hashlib
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import (
+    TestCase,
+    Client,
+    override_settings
+)
+from django.urls import reverse
+from library import ingest
+from library.models import (
+    Book,
+    BookBlob,
+    BookPage
+)
+from library.cache import parsed_books
+from library.serializers import parsed_book
+from library.test import (
+    EPUB,
+    TEST_CACHES,
+    MediaMixin,
+    upload_book
+)
+from users.models import User
+
+USERS = (123123213, 901283092, 371449298)
+
+client = Client()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestBookBlobs(MediaMixin, TestCase):
+    """Testing books uploaded by several users stored and parsed once"""
+
+    def setUp(self) -> None:
+        with open(EPUB, 'rb') as file:
+            self.sha256 = hashlib.sha256(file.read()).hexdigest()
+
+    def delete(self, book: Book):
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete(reverse('api_library:library_list_control'), content_type='application/json',
+                          data={'book_id': str(book.unique_id)})
+
+    def test_deduplicate(self):
+        books = [upload_book(vk_id, ingest=False) for vk_id in USERS[:2]]
+
+        blob = BookBlob.objects.get()
+        self.assertEqual(blob.sha256, self.sha256)
+        self.assertEqual(blob.references, 2)
+        self.assertEqual({book.file.name for book in books}, {blob.file.name})
+        self.assertEqual(len(default_storage.listdir(f'blobs/{self.sha256[:2]}')[1]), 1)
+
+        with mock.patch.object(ingest, 'parse_book', wraps=ingest.parse_book) as parse_book:
+            ingest.ingest_pending(workers=0)
+
+        # Both books are ready after a single parse
+        parse_book.assert_called_once()
+        blob.refresh_from_db()
+        self.assertEqual(BookPage.objects.all().filter(blob_id=blob).count(), blob.pages)
+        for book in books:
+            book.refresh_from_db()
+            self.assertEqual((book.state, book.pages, book.words), (Book.State.READY, blob.pages, blob.words))
+
+    def test_upload_parsed(self):
+        """Book of the file paginated before is ready at once"""
+        first = upload_book(USERS[0])
+        first.refresh_from_db()
+
+        with mock.patch('library.serializers.EpubParser', side_effect=AssertionError):
+            book = upload_book(USERS[1], ingest=False)
+
+        self.assertEqual(book.state, Book.State.READY)
+        self.assertEqual((book.title, book.pages), (first.title, first.pages))
+
+        response = client.get(reverse('api_library:library_list_control'), data={'book_id': book.unique_id, 'page': 2})
+        self.assertEqual(response.data['text'], BookPage.objects.get(blob_id=self.sha256, number=2).text)
+
+    def test_release(self):
+        """File is deleted along with the last book referencing it"""
+        books = [upload_book(vk_id, ingest=False) for vk_id in USERS]
+        ingest.ingest_pending(workers=0)
+        name = BookBlob.objects.get().file.name
+
+        for book in books[:-1]:
+            self.delete(book)
+
+        self.assertEqual(BookBlob.objects.get().references, 1)
+        self.assertTrue(default_storage.exists(name))
+
+        self.delete(books[-1])
+
+        self.assertFalse(BookBlob.objects.exists())
+        self.assertFalse(BookPage.objects.exists())
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(default_storage.exists(name + '.idx'))
+
+    def test_delete_processing(self):
+        """Book deleted while it's parsed is neither inserted again nor gets the pages"""
+        for error in (None, ValueError('broken')):
+            book = upload_book(USERS[0], ingest=False)
+
+            def parse_book(path):
+                result = parse(path)
+                self.delete(book)
+                if error:
+                    raise error
+                return result
+
+            parse = ingest.parse_book
+            with mock.patch.object(ingest, 'parse_book', side_effect=parse_book):
+                self.assertEqual(ingest.ingest_pending(workers=0), 0)
+
+            self.assertFalse(Book.objects.exists())
+            self.assertFalse(BookBlob.objects.exists())
+            self.assertFalse(BookPage.objects.exists())
+
+    def test_delete_user(self):
+        """Books deleted by the cascade release their blobs as well"""
+        upload_book(USERS[0], ingest=False)
+        upload_book(USERS[1], ingest=False)
+
+        User.objects.get(vk_id=USERS[0]).delete()
+
+        self.assertEqual(BookBlob.objects.get().references, 1)
+
+    def test_release_acquired_again(self):
+        """File released by one transaction and acquired by the next one before the removal is kept"""
+        book = upload_book(USERS[0], ingest=False)
+        name = BookBlob.objects.get().file.name
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            client.delete(reverse('api_library:library_list_control'), content_type='application/json',
+                          data={'book_id': str(book.unique_id)})
+        self.assertFalse(BookBlob.objects.exists())
+
+        upload_book(USERS[1], ingest=False)
+        for callback in callbacks:
+            callback()
+
+        self.assertTrue(default_storage.exists(name))
+
+    def test_store_before_transaction(self):
+        """File is copied before the transaction writing the book, it holds the write lock"""
+        depth, saved = len(connection.savepoint_ids), []
+        save = default_storage.save
+        with mock.patch.object(default_storage, 'save',
+                               side_effect=lambda *args: saved.append(len(connection.savepoint_ids)) or save(*args)):
+            upload_book(USERS[0], ingest=False)
+
+        self.assertEqual(saved, [depth])
+
+    def test_acquire_missing_file(self):
+        """File missing under the blob is saved again"""
+        upload_book(USERS[0], ingest=False)
+        name = BookBlob.objects.get().file.name
+        default_storage.delete(name)
+
+        upload_book(USERS[1], ingest=False)
+
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(BookBlob.objects.get().references, 2)
+
+    def test_parsed_book_shared(self):
+        """Books of the same blob share the cached book"""
+        books = [upload_book(vk_id, ingest=False) for vk_id in USERS[:2]]
+
+        self.assertIs(parsed_book(books[0]), parsed_book(books[1]))
+        parsed_books.invalidate(self.sha256)
@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+from datetime import datetime
+from django.test import SimpleTestCase
+from library.cache import ParsedBookCache
+
+BOOK_FILE = 'library/test/test_files/accessible_epub_3.epub'
+# Random book unique id
+RANDOM_UUID = 'f0653e13-aa84-4632-8f59-cc47141ea8cd'
+EDITED = datetime(2022, 7, 13)
+
+
+class TestParsedBookCache(SimpleTestCase):
+    """Testing per-process LRU cache of parsed books"""
+
+    def setUp(self) -> None:
+        # Sidecars are written next to the book, so keep them out of the test files.
+        self.directory = tempfile.mkdtemp()
+        self.path = shutil.copy(BOOK_FILE, self.directory)
+        self.cache = ParsedBookCache(max_bytes=64 * 1024 * 1024)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        """Same book is parsed only once"""
+
+        book = self.cache.get(RANDOM_UUID, self.path, EDITED)
+
+        self.assertIs(self.cache.get(RANDOM_UUID, self.path, EDITED), book)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['bytes'], book.retained_bytes())
+        self.assertLess(book.retained_bytes(), book.total_bytes())
+
+    def test_edited(self):
+        """Edited book is parsed again"""
+
+        book = self.cache.get(RANDOM_UUID, self.path, EDITED)
+
+        self.assertIsNot(self.cache.get(RANDOM_UUID, self.path, datetime.now()), book)
+        self.assertEqual(self.cache.stats()['misses'], 2)
+        self.assertEqual(len(self.cache), 1)
+
+    def test_invalidate(self):
+        """Invalidated book is dropped"""
+
+        self.cache.get(RANDOM_UUID, self.path, EDITED)
+        self.cache.invalidate(RANDOM_UUID)
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.stats()['bytes'], 0)
+
+    def test_eviction(self):
+        """Least recently used book is evicted when there is no space left"""
+
+        size = self.cache.get(RANDOM_UUID, self.path, EDITED).retained_bytes()
+        self.cache = ParsedBookCache(max_bytes=size * 2)
+
+        for unique_id in ('first', 'second', 'third'):
+            self.cache.get(unique_id, self.path, EDITED)
+
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_too_big(self):
+        """Book bigger than the whole cache isn't cached"""
+
+        self.cache = ParsedBookCache(max_bytes=1)
+        self.cache.get(RANDOM_UUID, self.path, EDITED)
+
+        self.assertEqual(len(self.cache), 0)
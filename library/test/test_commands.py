@@ -0,0 +1,93 @@
+import shutil
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from library import (
+    rsvp,
+    search
+)
+from library.models import (
+    Book,
+    BookBlob,
+    BookPage
+)
+from library.serializers import locate_word
+from library.test import MediaMixin
+from users.models import User
+
+BOOK_FILE = 'library/test/test_files/accessible_epub_3.epub'
+
+
+class TestImportBooks(MediaMixin, TestCase):
+    """Testing manage.py import_books"""
+
+    def setUp(self) -> None:
+        self.directory = Path(tempfile.mkdtemp())
+        shutil.copy(BOOK_FILE, self.directory / 'first.epub')
+        # The same book is a duplicate
+        shutil.copy(BOOK_FILE, self.directory / 'second.epub')
+        (self.directory / 'broken.epub').write_bytes(b'not an epub')
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def test_import(self):
+        """Import books, skip duplicates and report failures"""
+
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', str(self.directory), vk_id=123123213, workers=2,
+                     stdout=stdout, stderr=stderr)
+
+        book = Book.objects.get(vk_id=User.objects.get(vk_id=123123213))
+
+        self.assertEqual(book.state, Book.State.READY)
+        self.assertEqual(BookPage.objects.all().filter(**book.content_owner()).count(), book.pages)
+        self.assertIn('Imported 1, skipped 1 duplicates, failed 1 of 3 books', stdout.getvalue())
+        self.assertIn('broken.epub', stderr.getvalue())
+
+        # The duplicate released its reference to the blob.
+        blob = BookBlob.objects.get()
+        self.assertEqual((blob.references, blob.pages), (1, book.pages))
+        self.assertEqual(book.file.name, blob.file.name)
+
+        # Word index is written along with the file, so words are located without parsing the book.
+        with mock.patch.object(rsvp, 'write', side_effect=AssertionError):
+            self.assertEqual(locate_word(book, 0), (1, 0))
+            self.assertEqual(locate_word(book, book.words - 1)[0], book.pages)
+
+    def test_store_before_transaction(self):
+        """Files are copied before the transaction writing the books, it holds the write lock"""
+        depth, saved = len(connection.savepoint_ids), []
+        save = default_storage.save
+        with mock.patch.object(default_storage, 'save',
+                               side_effect=lambda *args: saved.append(len(connection.savepoint_ids)) or save(*args)):
+            call_command('import_books', str(self.directory), vk_id=123123213, workers=1, batch=1,
+                         stdout=StringIO(), stderr=StringIO())
+
+        self.assertEqual(saved, [depth])
+        self.assertEqual(Book.objects.get().state, Book.State.READY)
+
+    def test_import_shared(self):
+        """Imported books share the blobs with the uploaded ones and the other users"""
+
+        call_command('import_books', str(self.directory), vk_id=123123213, workers=1, stdout=StringIO(),
+                     stderr=StringIO())
+        call_command('import_books', str(self.directory), vk_id=901283092, workers=1, stdout=StringIO(),
+                     stderr=StringIO())
+
+        blob = BookBlob.objects.get()
+        self.assertEqual(blob.references, 2)
+        self.assertEqual(BookPage.objects.all().filter(blob_id=blob).count(), blob.pages)
+        name = blob.file.name.rsplit('/', 1)[1]
+        self.assertEqual(sorted(default_storage.listdir(f'blobs/{blob.sha256[:2]}')[1]), [name, name + rsvp.SUFFIX])
+
+        # Pages of the blob are indexed once and found by both of the users.
+        phrase = ' '.join(BookPage.objects.get(blob_id=blob, number=3).text.split()[100:103])
+        for vk_id in (123123213, 901283092):
+            self.assertIn(3, [hit['page'] for hit in search.search(vk_id, phrase)])
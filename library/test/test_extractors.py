@@ -0,0 +1,59 @@
+import re
+from bs4 import BeautifulSoup
+from django.test import SimpleTestCase
+from library.extractors import (
+    LxmlExtractor,
+    SoupExtractor,
+    get_extractor
+)
+from library.services import EpubParser
+
+BOOK_PATH = 'library/test/test_files/accessible_epub_3.epub'
+
+
+def extract_legacy(html: bytes) -> str:
+    """Text extraction before extraction backends were introduced"""
+    text = re.sub('((\n|\\s)+)', ' ', BeautifulSoup(html, 'html.parser').get_text())
+    return re.sub('(\r|\t|\v)', '', text).strip()
+
+
+class TestExtractors(SimpleTestCase):
+    """Testing HTML to text extraction backends"""
+
+    samples = [
+        b'',
+        b'\n\t\t<section><h2>Title</h2>\n\t\t\t<p>Some\n\t\t\t\ttext</p></section>',
+        b'<p>a<!-- comment -->b</p>',
+        b'<script>var x = 1;</script><style>p {}</style><template>t</template><p>text</p>',
+        b'<p>a&amp;b&#160;c</p>  <p>d<br/>e</p>',
+        b'<body class="main">text <b>bold</b> tail</body>',
+        'caf\xe9 ’'.encode('utf-8'),
+        'caf\xe9'.encode('latin-1'),
+    ]
+
+    def test_samples(self):
+        """Every backend extracts the same text"""
+
+        for html in self.samples:
+            self.assertEqual(SoupExtractor().extract(html), extract_legacy(html))
+            self.assertEqual(LxmlExtractor().extract(html), extract_legacy(html))
+
+    def test_book(self):
+        """Every backend extracts the same text from the book"""
+
+        book = EpubParser(BOOK_PATH, parse_text=False)
+
+        for item in book._chapter_items():
+            html = item.get_body_content()
+            self.assertEqual(LxmlExtractor().extract(html), extract_legacy(html))
+
+        self.assertEqual(list(EpubParser(BOOK_PATH, extractor=SoupExtractor())),
+                         list(EpubParser(BOOK_PATH, extractor=LxmlExtractor())))
+
+    def test_settings(self):
+        """Backend is selected in settings"""
+
+        with self.settings(LIBRARY_TEXT_EXTRACTOR='library.extractors.SoupExtractor'):
+            self.assertIsInstance(get_extractor(), SoupExtractor)
+
+        self.assertIsInstance(get_extractor(), LxmlExtractor)
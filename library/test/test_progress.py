@@ -0,0 +1,77 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db.models import Avg
+from django.test import TestCase
+from library.models import (
+    Book,
+    Statistics,
+    UserProgress
+)
+from library.serializers import LibraryAvgProgressBaseSerializer
+from users.models import User
+
+VK_ID = 123123213
+
+
+class TestUserProgress(TestCase):
+    """Testing running sums of the user reading statistics"""
+
+    def setUp(self) -> None:
+        user = User.objects.create(vk_id=VK_ID)
+        self.books = [
+            Book.objects.create(vk_id=user, title=title, author='Kafka Franz', pages=500, words=229000)
+            for title in ('The Trial', 'The Castle', 'Amerika')
+        ]
+        Statistics.objects.create(book_id=self.books[0], percentage=10, pages_read=50, words_read=22900,
+                                  average_speed=200)
+        Statistics.objects.create(book_id=self.books[1], percentage=30, pages_read=150, words_read=68700,
+                                  average_speed=300)
+
+    def assertProgress(self):
+        """Progress is the same as the aggregate over all the statistics of the user"""
+        stat = Statistics.objects.all().filter(book_id__vk_id=VK_ID).aggregate(
+            *(Avg(field) for field in Statistics.PROGRESS_FIELDS)
+        )
+        expected = {field: stat[f'{field}__avg'] for field in Statistics.PROGRESS_FIELDS}
+
+        with self.assertNumQueries(1):
+            progress = LibraryAvgProgressBaseSerializer({'vk_id': VK_ID}).data
+
+        self.assertEqual(progress, expected)
+
+    def test_create(self):
+        self.assertEqual(UserProgress.objects.get(pk=VK_ID).books, 2)
+        self.assertProgress()
+
+    def test_update(self):
+        stat = Statistics.objects.get(book_id=self.books[0])
+        stat.pages_read = 100
+        stat.save()
+
+        # Saved over the existing row without loading it
+        Statistics(book_id=self.books[1], percentage=40, pages_read=200, words_read=91600, average_speed=250).save()
+
+        self.assertEqual(UserProgress.objects.get(pk=VK_ID).books, 2)
+        self.assertProgress()
+
+    def test_delete(self):
+        Statistics.objects.get(book_id=self.books[0]).delete()
+        self.assertProgress()
+
+    def test_delete_book(self):
+        """Statistics deleted by the cascade from Book"""
+        self.books[1].delete()
+        self.assertProgress()
+
+        Book.objects.all().filter(vk_id=VK_ID).delete()
+        self.assertProgress()
+
+    def test_delete_user(self):
+        User.objects.get(vk_id=VK_ID).delete()
+        self.assertFalse(UserProgress.objects.all().exists())
+
+    def test_rebuild(self):
+        UserProgress.objects.all().update(books=100, pages_read=0)
+        call_command('rebuild_progress', stdout=StringIO())
+
+        self.assertProgress()
@@ -0,0 +1,89 @@
+from django.test import (
+    TestCase,
+    Client,
+    override_settings
+)
+from django.urls import reverse
+from rest_framework import status
+from library.models import (
+    Book,
+    Statistics
+)
+from library.test import (
+    TEST_CACHES,
+    MediaMixin,
+    upload_book
+)
+from users.models import User
+
+CONTENT_TYPE_JSON_APPLICATION = 'application/json'
+VK_ID = 123123213
+
+client = Client()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestQueryBudget(MediaMixin, TestCase):
+    """
+    Every endpoint issues a fixed amount of queries, however many books the user has
+
+    Raise the budget only along with the change of the access path.
+    """
+
+    def setUp(self) -> None:
+        user = User.objects.create(vk_id=VK_ID)
+        for number in range(20):
+            book = Book.objects.create(vk_id=user, title=f'Book {number}', author='Kafka Franz',
+                                       pages=100, words=10000)
+            Statistics.objects.create(book_id=book, percentage=number, pages_read=number, words_read=number,
+                                      average_speed=number)
+
+        self.book = upload_book(VK_ID)
+        self.stat = Statistics.objects.all().first()
+
+    def assertBudget(self, budget, method, name, expected=status.HTTP_200_OK, **kwargs):
+        with self.assertNumQueries(budget):
+            response = getattr(client, method)(reverse(name), **kwargs)
+            # Streamed content is read along with the queries.
+            if response.streaming:
+                b''.join(response.streaming_content)
+
+        self.assertEqual(response.status_code, expected)
+
+    def test_get_page(self):
+        # book and the stored page
+        self.assertBudget(2, 'get', 'api_library:library_list_control',
+                          data={'book_id': self.book.unique_id, 'page': 1})
+
+    def test_get_cached_page(self):
+        client.get(reverse('api_library:library_list_control'), data={'book_id': self.book.unique_id, 'page': 1})
+        self.assertBudget(1, 'get', 'api_library:library_list_control',
+                          data={'book_id': self.book.unique_id, 'page': 1})
+
+    def test_get_range(self):
+        self.assertBudget(2, 'get', 'api_library:library_list_control',
+                          data={'book_id': self.book.unique_id, 'page_from': 1, 'page_to': 3})
+
+    def test_get_state(self):
+        self.assertBudget(1, 'get', 'api_library:library_state_control', data={'book_id': self.book.unique_id})
+
+    def test_get_progress(self):
+        self.assertBudget(1, 'get', 'api_library:library_stat_control', data={'vk_id': VK_ID})
+
+    def test_get_book_progress(self):
+        self.assertBudget(1, 'get', 'api_library:library_stat_control',
+                          data={'vk_id': VK_ID, 'book_id': self.stat.book_id.unique_id})
+
+    def test_put_book_progress(self):
+        data = {'vk_id': VK_ID, 'book_id': str(self.stat.book_id.unique_id), 'pages_read': 1, 'words_read': 1,
+                'percentage': 1.0, 'average_speed': 1.0}
+        # book with the statistics, validation, update of the statistics and the user progress
+        self.assertBudget(8, 'put', 'api_library:library_stat_control',
+                          content_type=CONTENT_TYPE_JSON_APPLICATION, data=data)
+
+    def test_post(self):
+        with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
+            # user get_or_create within a savepoint, blob lookup, user and uniqueness validation,
+            # blob reference and book within a savepoint
+            self.assertBudget(12, 'post', 'api_library:library_list_control', expected=status.HTTP_202_ACCEPTED,
+                              data={'vk_id': VK_ID + 1, 'file': file})
@@ -0,0 +1,92 @@
+from datetime import (
+    datetime,
+    timezone
+)
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+from library.models import (
+    Book,
+    ReadingDay,
+    ReadingEvent,
+    Statistics,
+    UserProgress
+)
+from library.rollup import rollup_events
+from users.models import User
+
+VK_ID = 123123213
+
+
+def at(day, hour=12):
+    return datetime(2026, 10, day, hour, tzinfo=timezone.utc)
+
+
+class TestRollup(TestCase):
+    """Testing compaction of the reading events"""
+
+    def setUp(self) -> None:
+        user = User.objects.create(vk_id=VK_ID)
+        self.book = Book.objects.create(vk_id=user, title='The Trial', author='Kafka Franz', pages=100, words=10000)
+        ReadingEvent.objects.bulk_create([
+            ReadingEvent(book_id=self.book, word=300, words=300, started=at(1, 10), duration=60),
+            ReadingEvent(book_id=self.book, word=500, words=200, started=at(1, 20), duration=60),
+            ReadingEvent(book_id=self.book, word=1000, words=500, started=at(2), duration=120),
+        ])
+
+    def test_rollup(self):
+        self.assertEqual(rollup_events(), 3)
+
+        self.assertFalse(ReadingEvent.objects.exists())
+        days = list(ReadingDay.objects.all().values('day', 'events', 'words', 'seconds', 'last_word'))
+        self.assertEqual(days, [
+            {'day': at(1).date(), 'events': 2, 'words': 500, 'seconds': 120, 'last_word': 500},
+            {'day': at(2).date(), 'events': 1, 'words': 500, 'seconds': 120, 'last_word': 1000},
+        ])
+
+        stat = Statistics.objects.get(book_id=self.book)
+        self.assertEqual((stat.words_read, stat.pages_read, stat.percentage), (1000, 10, 10))
+        self.assertAlmostEqual(stat.average_speed, 250)
+        self.assertEqual(UserProgress.objects.get(pk=VK_ID).words_read, 1000)
+
+    def test_rollup_client_progress(self):
+        """Progress sent by the client after the events is kept, only the speed is recomputed"""
+        Statistics.objects.create(book_id=self.book, percentage=50, pages_read=50, words_read=5000, average_speed=1)
+        rollup_events()
+
+        stat = Statistics.objects.get(book_id=self.book)
+        self.assertEqual((stat.words_read, stat.pages_read, stat.percentage), (5000, 50, 50))
+        self.assertAlmostEqual(stat.average_speed, 250)
+        self.assertEqual(UserProgress.objects.get(pk=VK_ID).words_read, 5000)
+        self.assertAlmostEqual(UserProgress.objects.get(pk=VK_ID).average_speed, 250)
+
+    def test_rollup_batches(self):
+        """Events of the day compacted by different batches are summed up"""
+        self.assertEqual(rollup_events(limit=1), 1)
+        self.assertEqual(rollup_events(limit=1), 1)
+        self.assertEqual(ReadingDay.objects.get(day=at(1).date()).words, 500)
+
+        ReadingEvent.objects.create(book_id=self.book, word=1500, words=500, started=at(2, 18), duration=60)
+        self.assertEqual(rollup_events(), 2)
+        self.assertEqual(rollup_events(), 0)
+
+        day = ReadingDay.objects.get(day=at(2).date())
+        self.assertEqual((day.events, day.words, day.last_word), (2, 1000, 1500))
+        self.assertEqual(UserProgress.objects.get(pk=VK_ID).books, 1)
+
+    def test_speed(self):
+        rollup_events()
+
+        with mock.patch('django.utils.timezone.now', return_value=at(2)):
+            self.assertAlmostEqual(ReadingDay.speed(VK_ID, 1)['average_speed'], 250)
+            self.assertEqual(ReadingDay.speed(VK_ID, 30)['words'], 1000)
+
+        self.assertIsNone(ReadingDay.speed(VK_ID + 1, 30)['average_speed'])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('rollup_reading', '--once', stdout=out)
+
+        self.assertIn('Compacted 3 events', out.getvalue())
+        self.assertEqual(ReadingDay.objects.count(), 2)
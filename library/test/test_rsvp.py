@@ -0,0 +1,140 @@
+import os
+from django.test import (
+    TestCase,
+    Client,
+    override_settings
+)
+from django.urls import reverse
+from rest_framework import status
+from library import rsvp
+from library.models import BookPage
+from library.services import EpubParser
+from library.test import (
+    TEST_CACHES,
+    MediaMixin,
+    upload_book
+)
+
+VK_ID = 123123213
+
+client = Client()
+
+
+class TestRecognitionPoints(TestCase):
+
+    def test_orp(self):
+        self.assertEqual(rsvp.orp('a'), 0)
+        self.assertEqual(rsvp.orp('word'), 1)
+        self.assertEqual(rsvp.orp('reading'), 2)
+        self.assertEqual(rsvp.orp('recognition'), 3)
+        self.assertEqual(rsvp.orp('internationalization'), 4)
+
+    def test_orp_punctuation(self):
+        """Punctuation doesn't move the point"""
+        self.assertEqual(rsvp.orp('word,'), rsvp.orp('word'))
+        self.assertEqual(rsvp.orp('reading."'), rsvp.orp('reading'))
+
+    def test_delay(self):
+        self.assertEqual(rsvp.delay('word'), rsvp.BASE_DELAY)
+        self.assertGreater(rsvp.delay('word,'), rsvp.delay('word'))
+        self.assertGreater(rsvp.delay('word.'), rsvp.delay('word,'))
+        self.assertGreater(rsvp.delay('internationalization'), rsvp.delay('word'))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestLibraryWords(MediaMixin, TestCase):
+    """
+    Testing GET    /api/v1/library/words?book_id&word&count
+    """
+
+    def setUp(self) -> None:
+        self.book = upload_book(VK_ID)
+        self.pages = BookPage.objects.all().filter(**self.book.content_owner()).order_by('number')
+
+    def get(self, **data):
+        return client.get(reverse('api_library:library_words_control'), data=data)
+
+    def test_index_written(self):
+        """Index is written during the ingestion"""
+        self.assertTrue(os.path.exists(self.book.file.path + rsvp.SUFFIX))
+        index = rsvp.WordIndex(self.book.file.path)
+        self.assertEqual(len(index), sum(page.words for page in self.pages))
+        self.assertEqual(index.pages, self.book.pages)
+
+    def test_locate(self):
+        index = rsvp.WordIndex(self.book.file.path)
+        first = self.pages[0].words
+        self.assertEqual(index.locate(0), (1, 0))
+        self.assertEqual(index.locate(first - 1), (1, first - 1))
+        self.assertEqual(index.locate(first), (2, 0))
+        self.assertEqual(index.word(2, 3), first + 3)
+        for word in (0, first - 1, first, len(index) - 1):
+            self.assertEqual(index.word(*index.locate(word)), word)
+
+    def test_paginate(self):
+        """Pages of any size are the same as paginated by the parser"""
+        index = rsvp.WordIndex(self.book.file.path)
+        self.assertIs(index.paginate(), index.starts)
+        # Sizes with pages ending at the chapter joins and with the book ending by a full page
+        for words_per_page in (16, 17, 43, 75, 100, 128, 300, 512, 2000):
+            starts = [0]
+            for _, words in EpubParser(self.book.file.path, words_per_page=words_per_page):
+                starts.append(starts[-1] + words)
+
+            self.assertEqual(list(index.paginate(words_per_page)), starts)
+            self.assertIs(index.paginate(words_per_page), index.paginate(words_per_page))
+
+    def test_get(self):
+        response = self.get(book_id=self.book.unique_id, word=0, count=10)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tokens'], self.pages[0].text.split(' ')[:10])
+        self.assertEqual(response.data['orp'], [rsvp.orp(word) for word in response.data['tokens']])
+        self.assertEqual(response.data['delay'],
+                         [rsvp.delay(word) / rsvp.BASE_DELAY for word in response.data['tokens']])
+        self.assertEqual(response.data['words'], sum(page.words for page in self.pages))
+
+    def test_get_across_pages(self):
+        """Range crossing the page boundary is read from both pages"""
+        first = self.pages[0].words - 3
+        response = self.get(book_id=self.book.unique_id, word=first, count=6)
+
+        expected = self.pages[0].text.split(' ')[-3:] + self.pages[1].text.split(' ')[:3]
+        self.assertEqual(response.data['tokens'], expected)
+        self.assertEqual(len(response.data['orp']), 6)
+
+    def test_get_past_end(self):
+        response = self.get(book_id=self.book.unique_id, word=10 ** 9)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tokens'], [])
+
+    def test_get_count_capped(self):
+        with self.settings(LIBRARY_MAX_RSVP_WORDS=5):
+            response = self.get(book_id=self.book.unique_id, word=0, count=100)
+        self.assertEqual(len(response.data['tokens']), 5)
+
+    def test_get_stale_index(self):
+        """Missing index is rebuilt from the book"""
+        rsvp.remove(self.book.file.path)
+        response = self.get(book_id=self.book.unique_id, word=0, count=10)
+
+        self.assertEqual(response.data['tokens'], self.pages[0].text.split(' ')[:10])
+        self.assertTrue(os.path.exists(self.book.file.path + rsvp.SUFFIX))
+
+    def test_get_not_modified(self):
+        response = self.get(book_id=self.book.unique_id, word=0, count=10)
+        response = client.get(reverse('api_library:library_words_control'),
+                              data={'book_id': self.book.unique_id, 'word': 0, 'count': 10},
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_get_invalid(self):
+        self.assertEqual(self.get(book_id=self.book.unique_id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(book_id=self.book.unique_id, word=-1).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(book_id=self.book.unique_id, word='a').status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.get(word=0).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_unknown(self):
+        response = self.get(book_id='00000000-0000-0000-0000-000000000000', word=0)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
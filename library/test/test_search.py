@@ -0,0 +1,112 @@
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    TestCase,
+    Client
+)
+from django.urls import reverse
+from rest_framework import status
+from library import (
+    search,
+    sidecar
+)
+from library.models import (
+    Book,
+    BookPage
+)
+from library.test import (
+    MediaMixin,
+    upload_book
+)
+from users.models import User
+
+VK_ID = 123123213
+
+client = Client()
+
+
+class TestLibrarySearch(MediaMixin, TestCase):
+    """
+    Testing GET    /api/v1/library/search?vk_id&q
+    """
+
+    def setUp(self) -> None:
+        User.objects.create(vk_id=VK_ID + 1)
+        self.book = upload_book(VK_ID)
+        text = BookPage.objects.get(**self.book.content_owner(), number=3).text
+        self.phrase = ' '.join(text.split()[100:103])
+
+    def get(self, **data):
+        return client.get(reverse('api_library:library_search_control'), data=data)
+
+    def test_search(self):
+        response = self.get(vk_id=VK_ID, q=self.phrase)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        hits = response.data['hits']
+        self.assertIn(3, [hit['page'] for hit in hits])
+        hit = next(hit for hit in hits if hit['page'] == 3)
+        self.assertEqual(hit['book_id'], str(self.book.unique_id))
+        self.assertIn('<b>', hit['snippet'])
+
+    def test_search_other_user(self):
+        """Books of the other users are never found"""
+        self.assertEqual(self.get(vk_id=VK_ID + 1, q=self.phrase).data['hits'], [])
+
+    def test_search_syntax(self):
+        """Query is searched as a phrase, never as FTS5 syntax"""
+        response = self.get(vk_id=VK_ID, q='"unbalanced AND (')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['hits'], [])
+
+    def test_search_not_enough_params(self):
+        self.assertEqual(self.get(vk_id=VK_ID).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get(q=self.phrase).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.get(vk_id=VK_ID, q=self.phrase, limit='a').status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_spans(self):
+        """Pages of the other users inside the page range of the user are never found"""
+        other = Book.objects.create(vk_id=User.objects.get(vk_id=VK_ID + 1), title='Other', author='Other',
+                                    pages=1, words=3, state=Book.State.READY)
+        BookPage.objects.create(book_id=other, number=1, data=sidecar.pack_page(self.phrase), words=3)
+        # Page of the user after the page of the other user, so the range of the user covers it.
+        BookPage.objects.create(**self.book.content_owner(), number=self.book.pages + 1,
+                                data=sidecar.pack_page(self.phrase), words=3)
+
+        self.assertEqual(len(search._spans([self.book.blob_id_id], [])), 1)
+        hits = search.search(VK_ID, self.phrase)
+        self.assertIn(self.book.pages + 1, [hit['page'] for hit in hits])
+        self.assertEqual({hit['book'] for hit in hits}, {self.book})
+        self.assertEqual([hit['book'] for hit in search.search(VK_ID + 1, self.phrase)], [other])
+
+    def matches(self) -> int:
+        """Pages matching the phrase in the index itself, the text is out of it"""
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.TABLE} WHERE {search.TABLE} MATCH %s', [f'"{self.phrase}"'])
+            return cursor.fetchone()[0]
+
+    def test_external_content(self):
+        """Index has no copy of the text"""
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM sqlite_master WHERE name = '{search.TABLE}_content'")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_delete(self):
+        """Pages of the deleted book are removed from the index"""
+        self.assertGreater(self.matches(), 0)
+        client.delete(reverse('api_library:library_list_control'), content_type='application/json',
+                      data={'book_id': str(self.book.unique_id)})
+
+        self.assertEqual(self.matches(), 0)
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.TABLE} ({search.TABLE}) VALUES ('delete-all')")
+        self.assertEqual(self.get(vk_id=VK_ID, q=self.phrase).data['hits'], [])
+
+        out = StringIO()
+        call_command('rebuild_search', stdout=out)
+
+        self.assertIn(f'Indexed {self.book.pages} pages', out.getvalue())
+        self.assertNotEqual(self.get(vk_id=VK_ID, q=self.phrase).data['hits'], [])
@@ -0,0 +1,72 @@
+from django.test import SimpleTestCase
+from library.services import (
+    BookParser,
+    EpubParser
+)
+
+BOOK_PATH = 'library/test/test_files/accessible_epub_3.epub'
+
+
+class TextParser(BookParser):
+    """Parser of the already normalized chapters"""
+
+    def __init__(self, chapters, parse_text=True, words_per_page: int = 1024):
+        self.chapters = chapters
+        super().__init__(parse_text, words_per_page)
+
+    def _chapters(self):
+        return iter(self.chapters)
+
+
+class TestBookParser(SimpleTestCase):
+    """Testing pagination of the BookParser"""
+
+    def test_pages(self):
+        """Pages end with the first space after the max chars"""
+
+        book = TextParser(['aaa bbb ccc', 'ddd eee'], words_per_page=1)
+
+        self.assertEqual(book._pages, ['aaa bbb', 'ccc ddd', 'eee'])
+        self.assertEqual(book.get_page(1), ('aaa bbb', 2))
+
+    def test_chapter_join(self):
+        """Words of the adjacent chapters aren't glued together"""
+
+        book = TextParser(['aaa bbb', '', 'ccc'])
+
+        self.assertEqual(book._pages, ['aaa bbb ccc'])
+        self.assertEqual(book.total_words(), 3)
+
+    def test_no_space(self):
+        """Page without a space after the max chars takes the rest of the chapter"""
+
+        book = TextParser(['aaa bbbbbbb', 'ccc'], words_per_page=1)
+
+        self.assertEqual(book._pages, ['aaa bbbbbbb', 'ccc'])
+
+    def test_long_chapter(self):
+        """Very long chapter is paginated without recursion"""
+
+        book = TextParser([' '.join(['word'] * 200000)], words_per_page=1)
+
+        self.assertEqual(book.get_page(1), ('word word', 2))
+        # The book ends with a full page, so there are no empty remains.
+        self.assertEqual(len(book), 100000)
+        self.assertEqual(book.total_words(), 200000)
+
+    def test_missing_page(self):
+        """Missing page is empty"""
+
+        book = TextParser(['aaa bbb'])
+
+        self.assertEqual(book.get_page(2), ('', 0))
+        self.assertEqual(book.get_page(0), ('', 0))
+
+    def test_lazy(self):
+        """Text is parsed only until the requested page"""
+
+        book = EpubParser(BOOK_PATH, parse_text=False)
+        parsed = EpubParser(BOOK_PATH)
+
+        self.assertEqual(book.get_page(2), parsed.get_page(2))
+        self.assertEqual(len(book), 2)
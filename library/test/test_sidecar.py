@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import stat
+from django.test import (
+    SimpleTestCase,
+    override_settings
+)
+from library import (
+    rsvp,
+    sidecar
+)
+from library.services import EpubParser
+
+BOOK_FILE = 'library/test/test_files/accessible_epub_3.epub'
+
+
+class TestSidecar(SimpleTestCase):
+    """Testing memory-mapped plain-text sidecar of the book"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp()
+        self.path = shutil.copy(BOOK_FILE, self.directory)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def test_open_book(self):
+        """Sidecar is built on the first open and has the same pages"""
+
+        book = sidecar.open_book(self.path)
+        parsed = EpubParser(self.path)
+
+        self.assertIsInstance(book, sidecar.MappedBook)
+        self.assertTrue(os.path.exists(self.path + sidecar.TEXT_SUFFIX))
+        self.assertEqual(list(book), list(parsed))
+        self.assertEqual(len(book), len(parsed))
+        self.assertEqual(book.total_words(), parsed.total_words())
+        self.assertEqual(book.get_page(2), parsed.get_page(2))
+        self.assertEqual(book.get_page(len(book) + 1), ('', 0))
+
+    def test_missing(self):
+        """Sidecar can't be opened before it's built"""
+
+        with self.assertRaises(sidecar.SidecarError):
+            sidecar.MappedBook(self.path)
+
+    def test_stale(self):
+        """Sidecar of another page size is rebuilt"""
+
+        sidecar.write(self.path, EpubParser(self.path))
+
+        with self.assertRaises(sidecar.SidecarError):
+            sidecar.MappedBook(self.path, words_per_page=256)
+
+        book = sidecar.open_book(self.path, words_per_page=256)
+        self.assertEqual(list(book), list(EpubParser(self.path, words_per_page=256)))
+
+    def test_codecs(self):
+        """Every page is read the same, however the text is compressed"""
+
+        parsed = list(EpubParser(self.path))
+        sizes = {}
+        for codec, level, pages_per_block in (('none', 0, 1), ('zlib', 1, 1), ('zlib', 6, 4), ('lzma', 6, 3)):
+            book = sidecar.open_book(self.path, codec=codec, level=level, pages_per_block=pages_per_block)
+            sizes[codec] = book.disk_bytes()
+
+            self.assertEqual(list(book), parsed)
+            # Random access, the block of the page is decompressed alone
+            for page in (len(parsed), 1, 5, 2):
+                self.assertEqual(book.get_page(page), parsed[page - 1])
+            self.assertEqual(book.total_bytes(), sum(len(text.encode('utf-8')) for text, _ in parsed))
+
+        self.assertLess(sizes['zlib'], sizes['none'])
+
+    def test_stale_compression(self):
+        """Sidecar is rebuilt when the compression settings change"""
+
+        sidecar.write(self.path, EpubParser(self.path), codec='zlib', pages_per_block=4)
+
+        with self.settings(LIBRARY_SIDECAR_PAGES_PER_BLOCK=8):
+            with self.assertRaises(sidecar.SidecarError):
+                sidecar.MappedBook(self.path)
+
+        with self.assertRaises(sidecar.SidecarError):
+            sidecar.MappedBook(self.path, codec='lzma', pages_per_block=4)
+
+        self.assertEqual(len(sidecar.MappedBook(self.path, codec='zlib', pages_per_block=4)), len(EpubParser(self.path)))
+
+    def test_mismatched_text(self):
+        """Index published along with the text of another writer is stale"""
+
+        sidecar.write(self.path, EpubParser(self.path), codec='zlib', level=1)
+        text = self.path + sidecar.TEXT_SUFFIX
+        with open(text, 'rb') as file:
+            data = file.read()
+
+        sidecar.write(self.path, EpubParser(self.path), codec='zlib', level=9)
+        with open(text, 'wb') as file:
+            file.write(data)
+
+        with self.assertRaises(sidecar.SidecarError):
+            sidecar.MappedBook(self.path, codec='zlib', level=9)
+
+    def test_temporary_files(self):
+        """Writers use temporary files of their own and leave nothing behind"""
+
+        first = sidecar.temporary_file(self.path + sidecar.TEXT_SUFFIX)
+        second = sidecar.temporary_file(self.path + sidecar.TEXT_SUFFIX)
+        for file, _ in (first, second):
+            file.close()
+        self.assertNotEqual(first[1], second[1])
+        for _, name in (first, second):
+            os.remove(name)
+
+        sidecar.write(self.path, EpubParser(self.path))
+        # Writing fails in the middle of the book
+        book = EpubParser(self.path)
+        book._pages.append(None)
+        with self.assertRaises(AttributeError):
+            sidecar.write(self.path, book)
+
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted([
+            os.path.basename(self.path), os.path.basename(self.path) + sidecar.TEXT_SUFFIX,
+            os.path.basename(self.path) + sidecar.INDEX_SUFFIX,
+        ]))
+
+    def test_permissions(self):
+        """Sidecar and word index are readable as the uploaded files are, not by the owner only"""
+
+        sidecar.write(self.path, EpubParser(self.path))
+        rsvp.write(self.path, EpubParser(self.path))
+        for suffix in (sidecar.TEXT_SUFFIX, sidecar.INDEX_SUFFIX, rsvp.SUFFIX):
+            self.assertEqual(stat.S_IMODE(os.stat(self.path + suffix).st_mode), 0o644)
+
+        with override_settings(FILE_UPLOAD_PERMISSIONS=0o640):
+            sidecar.write(self.path, EpubParser(self.path))
+        self.assertEqual(stat.S_IMODE(os.stat(self.path + sidecar.TEXT_SUFFIX).st_mode), 0o640)
+
+    def test_pack_page(self):
+        """Page stored in the database is read the same whichever codec it was packed with"""
+
+        text, _ = EpubParser(self.path).get_page(2)
+        for codec in sidecar.CODECS:
+            self.assertEqual(sidecar.unpack_page(sidecar.pack_page(text, codec=codec)), text)
+            self.assertEqual(sidecar.unpack_page(memoryview(sidecar.pack_page(text, codec=codec))), text)
+
+        self.assertLess(len(sidecar.pack_page(text, codec='zlib')), len(text.encode('utf-8')))
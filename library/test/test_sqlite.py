@@ -0,0 +1,105 @@
+import os
+import tempfile
+import threading
+import time
+from django.db import (
+    connection,
+    connections,
+    transaction
+)
+from django.db.utils import load_backend
+from django.test import SimpleTestCase
+
+ALIAS = 'stress'
+
+
+class TestSqliteConcurrency(SimpleTestCase):
+    """
+    Stress test of the SQLite backend shared by several workers
+
+    Test database lives in memory, so a separate database file is used.
+    """
+
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'stress.sqlite3')
+
+        with self.connect() as cursor:
+            cursor.execute('CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER)')
+            cursor.execute('INSERT INTO counter VALUES (1, 0)')
+        connections[ALIAS].close()
+        self.addCleanup(lambda: connections[ALIAS].close())
+
+    def connect(self):
+        """Cursor of a new connection registered in the current thread, closed by the thread"""
+        wrapper = load_backend(connection.settings_dict['ENGINE']).DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': self.path}, alias=ALIAS
+        )
+        connections[ALIAS] = wrapper
+        return wrapper.cursor()
+
+    def run_threads(self, *targets):
+        errors = []
+
+        def run(target):
+            try:
+                target()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[ALIAS].close()
+
+        threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+    def test_pragmas(self):
+        with self.connect() as cursor:
+            self.assertEqual(cursor.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+            self.assertEqual(cursor.execute('PRAGMA busy_timeout').fetchone()[0], 5000)
+            # NORMAL
+            self.assertEqual(cursor.execute('PRAGMA synchronous').fetchone()[0], 1)
+
+    def test_read_during_write(self):
+        """Readers see the last commit while the writer holds the lock"""
+        written, read = threading.Event(), []
+
+        def write():
+            cursor = self.connect()
+            with transaction.atomic(using=ALIAS):
+                cursor.execute('UPDATE counter SET value = 1')
+                written.set()
+                time.sleep(0.5)
+
+        def read_value():
+            cursor = self.connect()
+            written.wait()
+            started = time.monotonic()
+            read.append((cursor.execute('SELECT value FROM counter').fetchone()[0], time.monotonic() - started))
+
+        self.run_threads(write, read_value)
+
+        value, seconds = read[0]
+        self.assertEqual(value, 0)
+        self.assertLess(seconds, 0.25)
+
+    def test_concurrent_writes(self):
+        """Read-modify-write transactions of many workers neither fail nor lose updates"""
+        workers, increments = 8, 25
+
+        def increment():
+            cursor = self.connect()
+            for _ in range(increments):
+                with transaction.atomic(using=ALIAS):
+                    value = cursor.execute('SELECT value FROM counter').fetchone()[0]
+                    cursor.execute('UPDATE counter SET value = %s', [value + 1])
+
+        self.run_threads(*[increment] * workers)
+
+        with self.connect() as cursor:
+            self.assertEqual(cursor.execute('SELECT value FROM counter').fetchone()[0], workers * increments)
@@ -1,18 +1,42 @@
+import asyncio
+import json
+from datetime import timedelta
+from unittest import mock
 from django.test import (
     TestCase,
-    Client
+    Client,
+    override_settings
 )
-from django.urls import reverse
+from django.urls import (
+    resolve,
+    reverse
+)
+from django.utils import timezone
 from rest_framework import status
 from library.models import (
     Book,
-    Statistics
+    BookPage,
+    ReadingEvent,
+    Statistics,
+    UserProgress
+)
+from library.cache import rendered_pages
+from library.ingest import (
+    claim_pending,
+    ingest_pending
 )
+from library.rollup import rollup_events
+from library.services import EpubParser
 from library.serializers import (
     BookViewSerializer,
     LibraryProgressModelSerializer,
     LibraryAvgProgressBaseSerializer
 )
+from library.test import (
+    TEST_CACHES,
+    MediaMixin,
+    upload_book
+)
 from users.models import User
 
 CONTENT_TYPE_JSON_APPLICATION = 'application/json'
@@ -22,13 +46,16 @@ RANDOM_UUID = 'f0653e13-aa84-4632-8f59-cc47141ea8cd'
 client = Client()
 
 
-class TestLibraryModelViewSet(TestCase):
+@override_settings(CACHES=TEST_CACHES)
+class TestLibraryModelViewSet(MediaMixin, TestCase):
     """
     Testing POST   /api/v1/library
             GET    /api/v1/library?book_id&page
             DELETE /api/v1/library?book_id
     """
 
+    list_url = 'api_library:library_list_control'
+
     def setUp(self) -> None:
         # Create two users with unique vk_id
         User.objects.create(vk_id=123123213)
@@ -50,22 +77,71 @@ class TestLibraryModelViewSet(TestCase):
 
         book = Book.objects.all().first()
         book_serialization = BookViewSerializer(book, context={'page': 1})
-        response = client.get(reverse('api_library:library_list_control'), data={'book_id': book.unique_id, 'page': 1})
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, book_serialization.data)
 
+    def test_get_not_modified(self):
+        """Get page the client already has"""
+
+        book = Book.objects.all().first()
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('public', response['Cache-Control'])
+
+        with mock.patch.object(BookViewSerializer, 'get_book_info', side_effect=AssertionError):
+            cached = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1},
+                                HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(cached['ETag'], response['ETag'])
+
+        # Another page has another ETag
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 2},
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_rendered(self):
+        """Get page rendered by another request"""
+
+        book = Book.objects.all().first()
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        with mock.patch.object(BookViewSerializer, 'get_book_info', side_effect=AssertionError):
+            cached = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        self.assertEqual(cached.data, response.data)
+
+        rendered_pages.invalidate(book.unique_id)
+        with mock.patch.object(BookViewSerializer, 'get_book_info', return_value=('text', 1, 1, 1)):
+            response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        self.assertEqual(response.data['text'], 'text')
+
+    def test_get_modified(self):
+        """Get page of the book which was updated since the last request"""
+
+        book = Book.objects.all().first()
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+        book.save()
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1},
+                              HTTP_IF_NONE_MATCH=response['ETag'])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
     def test_get_wrong_book_id(self):
         """Get book with non-existing book_id param"""
 
-        response = client.get(reverse('api_library:library_list_control'), data={'book_id': RANDOM_UUID, 'page': 1})
+        response = client.get(reverse(self.list_url), data={'book_id': RANDOM_UUID, 'page': 1})
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
     def test_get_wrong_page(self):
         """Get book with either too-small or too-big page number."""
 
-        response = client.get(reverse('api_library:library_list_control'), data={'book_id': RANDOM_UUID, 'page': -1})
+        response = client.get(reverse(self.list_url), data={'book_id': RANDOM_UUID, 'page': -1})
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
@@ -73,11 +149,11 @@ class TestLibraryModelViewSet(TestCase):
         """Send request without one of the params: book_id/page"""
 
         book = Book.objects.all().first()
-        response = client.get(reverse('api_library:library_list_control'), data={'book_id': book.unique_id})
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id})
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        response = client.get(reverse('api_library:library_list_control'), data={'page': 1})
+        response = client.get(reverse(self.list_url), data={'page': 1})
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
@@ -85,27 +161,245 @@ class TestLibraryModelViewSet(TestCase):
         """Send book correctly"""
 
         with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
-            request = client.post(reverse('api_library:library_list_control'), data={'vk_id': 123123213, 'file': file})
+            request = client.post(reverse(self.list_url), data={'vk_id': 123123213, 'file': file})
 
         # Get the book we just uploaded
         book = Book.objects.all().filter(vk_id=User.objects.get(vk_id=123123213)).last()
 
-        self.assertEqual(request.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(request.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(request.data['state'], Book.State.PENDING)
         self.assertEqual(book.vk_id, User.objects.get(vk_id=123123213))
         self.assertTrue(book.file)
 
+    def test_post_pages(self):
+        """Uploaded book is paginated once and saved to the page store"""
+
+        book = upload_book(123123213)
+        pages = BookPage.objects.all().filter(**book.content_owner())
+
+        self.assertEqual(pages.count(), book.pages)
+        self.assertEqual(sum(page.words for page in pages), book.words)
+
+    def test_get_stored_page(self):
+        """Get page of the uploaded book from the page store"""
+
+        book = upload_book(123123213)
+        page = BookPage.objects.all().get(**book.content_owner(), number=2)
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 2})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['text'], page.text)
+        self.assertEqual(response.data['words'], page.words)
+        self.assertEqual(response.data['pages'], book.pages)
+
+    def test_get_range(self):
+        """Get range of pages streamed as NDJSON"""
+
+        book = upload_book(123123213)
+        response = client.get(reverse(self.list_url),
+                              data={'book_id': book.unique_id, 'page_from': 2, 'page_to': 4})
+        pages = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([page['page'] for page in pages], [2, 3, 4])
+        for page in pages:
+            serialized = BookViewSerializer(book, context={'page': page['page']}).data
+            self.assertEqual(page['text'], serialized['text'])
+            self.assertEqual(page['words'], serialized['words'])
+
+    def test_get_range_capped(self):
+        """Get range of pages which is bigger than the server limit"""
+
+        book = upload_book(123123213)
+        with self.settings(LIBRARY_MAX_PAGE_RANGE=2):
+            response = client.get(reverse(self.list_url),
+                                  data={'book_id': book.unique_id, 'page_from': 1, 'page_to': 10})
+            pages = b''.join(response.streaming_content).splitlines()
+
+        self.assertEqual(len(pages), 2)
+
+    def test_get_word(self):
+        """Get page containing the word counted through the whole book"""
+
+        book = upload_book(123123213)
+        first, second = BookPage.objects.all().filter(**book.content_owner(), number__in=(1, 2)).order_by('number')
+        for word, page, offset in ((0, 1, 0), (first.words - 1, 1, first.words - 1),
+                                   (first.words, 2, 0), (first.words + 5, 2, 5)):
+            response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'word': word})
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual((response.data['page'], response.data['offset']), (page, offset))
+            self.assertEqual(response.data['word'], word)
+            self.assertEqual(response.data['text'], (first, second)[page - 1].text)
+
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'word': book.words - 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['page'], book.pages)
+
+        for word in (book.words, book.words + 1, 10 ** 9):
+            response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'word': word})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_words_per_page(self):
+        """Get pages of another size cut out of the stored pages"""
+
+        book = upload_book(123123213)
+        expected = list(EpubParser(book.file.path, words_per_page=300))
+        for number in (1, 2, len(expected)):
+            response = client.get(reverse(self.list_url),
+                                  data={'book_id': book.unique_id, 'page': number, 'words_per_page': 300})
+
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual((response.data['text'], response.data['words']), expected[number - 1])
+            self.assertEqual(response.data['pages'], len(expected))
+
+        response = client.get(reverse(self.list_url),
+                              data={'book_id': book.unique_id, 'page_from': 3, 'page_to': 5, 'words_per_page': 300})
+        pages = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(page['text'], page['words']) for page in pages], expected[2:5])
+
+    def test_get_word_words_per_page(self):
+        """Word is at the same position of the book whatever the size of the pages"""
+
+        book = upload_book(123123213)
+        word = 5000
+        tokens = set()
+        for words_per_page in (100, 1024, 2000):
+            response = client.get(reverse(self.list_url),
+                                  data={'book_id': book.unique_id, 'word': word, 'words_per_page': words_per_page})
+            tokens.add(response.data['text'].split(' ')[response.data['offset']])
+
+        self.assertEqual(len(tokens), 1)
+
+    def test_get_wrong_words_per_page(self):
+        """Get page of invalid size"""
+
+        book = Book.objects.all().first()
+        for words_per_page in ('a', 0, 10 ** 6):
+            response = client.get(reverse(self.list_url),
+                                  data={'book_id': book.unique_id, 'page': 1, 'words_per_page': words_per_page})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_wrong_word(self):
+        """Get page by invalid word offset"""
+
+        book = Book.objects.all().first()
+        for word in ('a', -1):
+            response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'word': word})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = client.get(reverse(self.list_url), data={'book_id': RANDOM_UUID, 'word': 1})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+    def test_get_wrong_range(self):
+        """Get range of pages with invalid bounds"""
+
+        book = Book.objects.all().first()
+        for data in ({'page_from': 'a'}, {'page_from': 0}, {'page_from': 3, 'page_to': 2}):
+            response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, **data})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_without_page_store(self):
+        """Get pages of the book without the page store by parsing its file"""
+
+        book = upload_book(123123213)
+        pages = [(page.text, page.words) for page in BookPage.objects.all().filter(**book.content_owner())]
+        BookPage.objects.all().filter(**book.content_owner()).delete()
+
+        for number in (1, 2, book.pages):
+            response = client.get(reverse(self.list_url),
+                                  data={'book_id': book.unique_id, 'page': number})
+            self.assertEqual((response.data['text'], response.data['words']), pages[number - 1])
+
+        response = client.get(reverse(self.list_url),
+                              data={'book_id': book.unique_id, 'page': book.pages + 1})
+        self.assertEqual(response.data['text'], '')
+
+    def test_get_pending(self):
+        """Get page of the book which isn't parsed yet"""
+
+        with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
+            client.post(reverse(self.list_url), data={'vk_id': 123123213, 'file': file})
+
+        book = Book.objects.all().filter(vk_id=User.objects.get(vk_id=123123213)).last()
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['state'], Book.State.PENDING)
+
+    def test_state(self):
+        """Get ingestion state of the uploaded book"""
+
+        with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
+            client.post(reverse(self.list_url), data={'vk_id': 123123213, 'file': file})
+
+        book = Book.objects.all().filter(vk_id=User.objects.get(vk_id=123123213)).last()
+        response = client.get(reverse('api_library:library_state_control'), data={'book_id': book.unique_id})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], Book.State.PENDING)
+
+        # Parse in the pool of processes
+        self.assertEqual(ingest_pending(workers=1), 1)
+        response = client.get(reverse('api_library:library_state_control'), data={'book_id': book.unique_id})
+
+        self.assertEqual(response.data['state'], Book.State.READY)
+        self.assertEqual(ingest_pending(workers=1), 0)
+
+    def test_state_stale(self):
+        """Book claimed by a worker which died is taken from the queue again"""
+
+        with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
+            client.post(reverse(self.list_url), data={'vk_id': 123123213, 'file': file})
+
+        book = Book.objects.all().filter(vk_id=User.objects.get(vk_id=123123213)).last()
+        self.assertEqual(claim_pending(), [book])
+        book.refresh_from_db()
+        self.assertEqual(book.state, Book.State.PROCESSING)
+        self.assertIsNotNone(book.claimed)
+
+        # The worker is still parsing it
+        self.assertEqual(ingest_pending(workers=0), 0)
+
+        Book.objects.all().filter(pk=book.pk).update(claimed=timezone.now() - timedelta(hours=1))
+        self.assertEqual(ingest_pending(workers=0), 1)
+        book.refresh_from_db()
+        self.assertEqual(book.state, Book.State.READY)
+
+    def test_state_failed(self):
+        """Book which can't be parsed is failed"""
+
+        book = Book.objects.all().first()
+        book.file = 'books/missing.epub'
+        book.state = Book.State.PENDING
+        book.save()
+        ingest_pending(workers=0)
+
+        response = client.get(reverse(self.list_url), data={'book_id': book.unique_id, 'page': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(response.data['state'], Book.State.FAILED)
+
+    def test_state_wrong_book_id(self):
+        """Get ingestion state with non-existing book_id param"""
+
+        response = client.get(reverse('api_library:library_state_control'), data={'book_id': RANDOM_UUID})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
     def test_post_unregistered_vk_id(self):
         """Send book with non-existing vk_id param"""
 
         with open('library/test/test_files/accessible_epub_3.epub', 'rb') as file:
-            request = client.post(reverse('api_library:library_list_control'), data={'vk_id': 123, 'file': file})
+            request = client.post(reverse(self.list_url), data={'vk_id': 123, 'file': file})
 
-        self.assertEqual(request.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(request.status_code, status.HTTP_202_ACCEPTED)
 
     def test_post_empty_file(self):
         """Send book with an empty file"""
 
-        request = client.post(reverse('api_library:library_list_control'), data={'vk_id': 123, 'file': ''})
+        request = client.post(reverse(self.list_url), data={'vk_id': 123, 'file': ''})
         self.assertEqual(request.status_code, status.HTTP_204_NO_CONTENT)
 
     def test_delete(self):
@@ -114,20 +408,20 @@ class TestLibraryModelViewSet(TestCase):
         book = Book.objects.all().last()
         book_id = book.unique_id
 
-        request = client.delete(reverse('api_library:library_list_control'),
+        request = client.delete(reverse(self.list_url),
                                 content_type=CONTENT_TYPE_JSON_APPLICATION,
                                 data={'book_id': book_id})
 
         self.assertEqual(request.status_code, status.HTTP_200_OK)
 
-        response = client.get(reverse('api_library:library_list_control'), data={'book_id': book_id, 'page': 1})
+        response = client.get(reverse(self.list_url), data={'book_id': book_id, 'page': 1})
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
     def test_delete_wrong_book_id(self):
         """Delete book with wrong book_id"""
 
-        request = client.delete(reverse('api_library:library_list_control'),
+        request = client.delete(reverse(self.list_url),
                                 content_type=CONTENT_TYPE_JSON_APPLICATION,
                                 data={'book_id': RANDOM_UUID})
 
@@ -135,6 +429,8 @@ class TestLibraryModelViewSet(TestCase):
 
 
 class TestStatisticsModelViewSet(TestCase):
+    stat_url = 'api_library:library_stat_control'
+
     def setUp(self) -> None:
         # Create two users with unique vk_id
         User.objects.create(vk_id=123123213)
@@ -166,7 +462,7 @@ class TestStatisticsModelViewSet(TestCase):
             'percentage': 1.0,
             'average_speed': 1.0
         }
-        request = client.put(reverse('api_library:library_stat_control'),
+        request = client.put(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data=data)
         self.assertEqual(request.status_code, status.HTTP_200_OK)
@@ -182,10 +478,30 @@ class TestStatisticsModelViewSet(TestCase):
             'percentage': 1.0,
             'average_speed': 1
         }
-        request = client.put(reverse('api_library:library_stat_control'),
+        data['pages_read'] = 7
+        request = client.put(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data=data)
         self.assertEqual(request.status_code, status.HTTP_200_OK)
+        self.assertEqual(Statistics.objects.all().filter(book_id=book).count(), 1)
+        self.assertEqual(Statistics.objects.get(book_id=book).pages_read, 7)
+
+    def test_update_foreign_stat(self):
+        """Update book stat of another user"""
+        book = Book.objects.all().last()
+        data = {
+            'book_id': book.unique_id,
+            'vk_id': 901283092,
+            'pages_read': 7,
+            'words_read': 1,
+            'percentage': 1.0,
+            'average_speed': 1.0
+        }
+        request = client.put(reverse(self.stat_url),
+                             content_type=CONTENT_TYPE_JSON_APPLICATION,
+                             data=data)
+        self.assertEqual(request.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(Statistics.objects.get(book_id=book).pages_read, 1)
 
     def test_update_wrong_book_id(self):
         """Update book stat with a wrong book_id"""
@@ -197,7 +513,7 @@ class TestStatisticsModelViewSet(TestCase):
             'percentage': 1.0,
             'average_speed': 1.0
         }
-        request = client.put(reverse('api_library:library_stat_control'),
+        request = client.put(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data=data)
         self.assertEqual(request.status_code, status.HTTP_204_NO_CONTENT)
@@ -208,7 +524,7 @@ class TestStatisticsModelViewSet(TestCase):
         vk_id = Book.objects.all().filter(unique_id=user_stat.book_id.unique_id).first().vk_id.vk_id
         user_stat_serialized = LibraryAvgProgressBaseSerializer({'vk_id': vk_id})
 
-        request = client.get(reverse('api_library:library_stat_control'),
+        request = client.get(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data={'vk_id': vk_id})
         self.assertEqual(request.status_code, status.HTTP_200_OK)
@@ -221,18 +537,185 @@ class TestStatisticsModelViewSet(TestCase):
         book_id = user_stat.book_id.unique_id
         user_stat_serialized = LibraryProgressModelSerializer(user_stat)
 
-        request = client.get(reverse('api_library:library_stat_control'),
+        request = client.get(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data={'vk_id': vk_id, 'book_id': book_id})
         self.assertEqual(request.status_code, status.HTTP_200_OK)
         self.assertEqual(request.data, user_stat_serialized.data)
 
+    def test_get_specific_stat_not_modified(self):
+        """Get book stat the client already has"""
+        user_stat = Statistics.objects.all().first()
+        data = {'vk_id': user_stat.book_id.vk_id_id, 'book_id': user_stat.book_id.unique_id}
+
+        request = client.get(reverse(self.stat_url), data=data)
+        self.assertTrue(request.has_header('Last-Modified'))
+        self.assertIn('no-cache', request['Cache-Control'])
+
+        cached = client.get(reverse(self.stat_url), data=data, HTTP_IF_NONE_MATCH=request['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        user_stat.pages_read = 2
+        user_stat.save()
+        request = client.get(reverse(self.stat_url), data=data, HTTP_IF_NONE_MATCH=request['ETag'])
+        self.assertEqual(request.status_code, status.HTTP_200_OK)
+
     def test_get_wrong_stat(self):
         """Get book stat with wrong book_id"""
         user_stat = Statistics.objects.all().first()
         vk_id = Book.objects.all().filter(unique_id=user_stat.book_id.unique_id).first().vk_id_id
 
-        request = client.get(reverse('api_library:library_stat_control'),
+        request = client.get(reverse(self.stat_url),
                              content_type=CONTENT_TYPE_JSON_APPLICATION,
                              data={'vk_id': vk_id, 'book_id': RANDOM_UUID})
         self.assertEqual(request.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class TestAsyncLibraryModelViewSet(TestLibraryModelViewSet):
+    """Same contract served by the async views"""
+
+    list_url = 'api_library:async_library_list_control'
+
+    def test_async(self):
+        """Django serves the view without a thread of its own"""
+        self.assertTrue(asyncio.iscoroutinefunction(resolve(reverse(self.list_url)).func))
+
+
+class TestAsyncStatisticsModelViewSet(TestStatisticsModelViewSet):
+    """Same contract served by the async views"""
+
+    stat_url = 'api_library:async_library_stat_control'
+
+
+class TestStatisticsBulkViewSet(TestCase):
+    """
+    Testing POST   /api/v1/library/progress/bulk
+    """
+
+    def setUp(self) -> None:
+        User.objects.create(vk_id=123123213)
+        User.objects.create(vk_id=901283092)
+
+        for title in ("Kafka on the Shore", "The Old Man and the Sea", "The Trial"):
+            Book.objects.create(vk_id=User.objects.get(vk_id=123123213), title=title, pages=100, words=1000)
+        Book.objects.create(vk_id=User.objects.get(vk_id=901283092), title="Foreign", pages=100, words=1000)
+
+        Statistics.objects.create(book_id=Book.objects.all().filter(title="The Trial").first(),
+                                  percentage=1, pages_read=1, words_read=1, average_speed=1)
+
+    @staticmethod
+    def item(book, pages_read=10):
+        return {'book_id': str(book.unique_id), 'pages_read': pages_read, 'words_read': pages_read * 10,
+                'percentage': pages_read / 100, 'average_speed': 200.0}
+
+    def test_bulk(self):
+        """Create and update statistics of several books at once"""
+        books = list(Book.objects.all().filter(vk_id=123123213).order_by('title'))
+        data = {'vk_id': 123123213, 'items': [self.item(book) for book in books]}
+
+        # ownership, existing statistics, insert, update and user progress
+        with self.assertNumQueries(7):
+            request = client.post(reverse('api_library:library_stat_bulk_control'),
+                                  content_type=CONTENT_TYPE_JSON_APPLICATION, data=data)
+
+        self.assertEqual(request.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in request.data['items']], ['created', 'created', 'updated'])
+        for book in books:
+            self.assertEqual(Statistics.objects.get(book_id=book).pages_read, 10)
+
+        # The running sums are kept in sync with bulk queries.
+        progress = UserProgress.objects.get(vk_id=123123213)
+        self.assertEqual(progress.books, 3)
+        self.assertEqual(progress.pages_read, 30)
+
+    def test_bulk_statuses(self):
+        """Report duplicates, books of other users and invalid items"""
+        book = Book.objects.all().filter(vk_id=123123213).first()
+        foreign = Book.objects.all().filter(vk_id=901283092).first()
+        data = {'vk_id': 123123213, 'items': [
+            self.item(book, 5),
+            self.item(book, 6),
+            self.item(foreign),
+            {'book_id': RANDOM_UUID},
+            {'book_id': 'not-a-uuid', 'pages_read': 1, 'words_read': 1, 'percentage': 1, 'average_speed': 1},
+        ]}
+
+        request = client.post(reverse('api_library:library_stat_bulk_control'),
+                              content_type=CONTENT_TYPE_JSON_APPLICATION, data=data)
+
+        self.assertEqual(request.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['status'] for item in request.data['items']],
+                         ['duplicate', 'created', 'not_found', 'invalid', 'invalid'])
+        self.assertEqual(Statistics.objects.get(book_id=book).pages_read, 6)
+        self.assertFalse(Statistics.objects.all().filter(book_id=foreign).exists())
+
+    def test_bulk_too_large(self):
+        """Reject batches above the limit"""
+        book = Book.objects.all().first()
+        data = {'vk_id': 123123213, 'items': [self.item(book)] * 1001}
+
+        request = client.post(reverse('api_library:library_stat_bulk_control'),
+                              content_type=CONTENT_TYPE_JSON_APPLICATION, data=data)
+        self.assertEqual(request.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_empty(self):
+        """Reject batches without items"""
+        request = client.post(reverse('api_library:library_stat_bulk_control'),
+                              content_type=CONTENT_TYPE_JSON_APPLICATION, data={'vk_id': 123123213, 'items': []})
+        self.assertEqual(request.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TestReadingEventViewSet(TestCase):
+    """
+    Testing POST   /api/v1/library/events
+            GET    /api/v1/library/events?vk_id&days
+    """
+
+    def setUp(self) -> None:
+        User.objects.create(vk_id=123123213)
+        User.objects.create(vk_id=901283092)
+        self.book = Book.objects.create(vk_id=User.objects.get(vk_id=123123213), title="The Trial",
+                                        pages=100, words=10000)
+        self.foreign = Book.objects.create(vk_id=User.objects.get(vk_id=901283092), title="Foreign",
+                                           pages=100, words=1000)
+
+    @staticmethod
+    def event(book, word=100):
+        return {'book_id': str(book.unique_id), 'word': word, 'words': 100,
+                'started': timezone.now().isoformat(), 'duration': 30.0}
+
+    def test_post(self):
+        data = {'vk_id': 123123213, 'events': [self.event(self.book), self.event(self.book, 200),
+                                               self.event(self.foreign)]}
+
+        # ownership and a single insert
+        with self.assertNumQueries(2):
+            request = client.post(reverse('api_library:library_events_control'),
+                                  content_type=CONTENT_TYPE_JSON_APPLICATION, data=data)
+
+        self.assertEqual(request.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(request.data, {'stored': 2, 'rejected': 1})
+        self.assertEqual(ReadingEvent.objects.all().filter(book_id=self.book).count(), 2)
+
+    def test_post_invalid(self):
+        event = self.event(self.book)
+        event['duration'] = -1
+        request = client.post(reverse('api_library:library_events_control'),
+                              content_type=CONTENT_TYPE_JSON_APPLICATION,
+                              data={'vk_id': 123123213, 'events': [event]})
+
+        self.assertEqual(request.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(ReadingEvent.objects.exists())
+
+    def test_get(self):
+        client.post(reverse('api_library:library_events_control'), content_type=CONTENT_TYPE_JSON_APPLICATION,
+                    data={'vk_id': 123123213, 'events': [self.event(self.book)]})
+        rollup_events()
+
+        request = client.get(reverse('api_library:library_events_control'), data={'vk_id': 123123213, 'days': 7})
+        self.assertEqual(request.status_code, status.HTTP_200_OK)
+        self.assertEqual(request.data['average_speed'], 200)
+
+    def test_get_not_enough_params(self):
+        request = client.get(reverse('api_library:library_events_control'))
+        self.assertEqual(request.status_code, status.HTTP_204_NO_CONTENT)
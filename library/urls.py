@@ -1,11 +1,27 @@
 from django.urls import path, include
+from library.async_views import (
+    AsyncLibraryRetrieveViewSet,
+    AsyncStatisticsViewSet,
+)
 from library.views import (
     LibraryRetrieveViewSet,
+    LibraryStateViewSet,
     StatisticsViewSet,
+    StatisticsBulkViewSet,
+    ReadingEventViewSet,
+    LibrarySearchViewSet,
+    LibraryWordsViewSet,
 )
 
 app_name = 'api_library'
 urlpatterns = [
     path('', LibraryRetrieveViewSet.as_view(), name='library_list_control'),
+    path('state/', LibraryStateViewSet.as_view(), name='library_state_control'),
     path('progress/', StatisticsViewSet.as_view(), name='library_stat_control'),
+    path('progress/bulk/', StatisticsBulkViewSet.as_view(), name='library_stat_bulk_control'),
+    path('async/', AsyncLibraryRetrieveViewSet.as_view(), name='async_library_list_control'),
+    path('async/progress/', AsyncStatisticsViewSet.as_view(), name='async_library_stat_control'),
+    path('events/', ReadingEventViewSet.as_view(), name='library_events_control'),
+    path('search/', LibrarySearchViewSet.as_view(), name='library_search_control'),
+    path('words/', LibraryWordsViewSet.as_view(), name='library_words_control'),
 ]
@@ -1,6 +1,9 @@
+import json
+from django.conf import settings
 from django.db.models import (
     Q
 )
+from django.http import StreamingHttpResponse
 from rest_framework.generics import (
     RetrieveAPIView,
     CreateAPIView,
@@ -14,14 +17,37 @@ from rest_framework.request import Request
 from library.serializers import (
     BookViewSerializer,
     BookCreateSerializer,
+    BookStateSerializer,
     LibraryProgressModelSerializer,
-    LibraryAvgProgressBaseSerializer
+    LibraryProgressBulkSerializer,
+    LibraryAvgProgressBaseSerializer,
+    ReadingEventBulkSerializer,
+    ReadingSpeedBaseSerializer,
+    SearchHitSerializer,
+    WordStreamSerializer,
+    locate_word
 )
+from library import search
 from users.models import User
+from library.cache import (
+    parsed_books,
+    rendered_pages
+)
+from library.http import (
+    cache_pages,
+    cache_statistics,
+    not_modified,
+    page_etag,
+    position_etag,
+    set_validators,
+    statistics_etag,
+    words_etag
+)
 from library.models import (
     Book,
     Statistics
 )
+from library.services import WORDS_PER_PAGE
 
 
 class LibraryRetrieveViewSet(
@@ -33,6 +59,10 @@ class LibraryRetrieveViewSet(
     View to control user book-library
 
     GET book details by book_id and text by page
+    GET book details by book_id and text of the page containing word, counted from 0 through the whole book,
+    400 past the last word
+    GET book details by book_id and text of pages from page_from to page_to, streamed as NDJSON
+    GET accepts words_per_page to read the pages of another size, 1024 words by default
     POST user_id and file
     DELETE by book_id
     """
@@ -44,29 +74,155 @@ class LibraryRetrieveViewSet(
 
     def get(self, request: Request, *args, **kwargs):
         """Get book details and text by submitting book_id and page"""
-        # Can't use values() or items() because params might not be in request.
         # TODO: add vk_id to make sure the right params are sent
         # TODO: Check for valid type
         # TODO: move logic to serializer. use BaseSerializer if required.
+        params, response = self.parse_query(request)
+        if response is not None:
+            return response
+
+        book = self.find_book(params)
+        etag, response = self.check_book(request, book, params)
+        if response is None:
+            response = cache_pages(set_validators(self.read(book, params), etag, book.edited))
+
+        return response
+
+    def parse_query(self, request: Request) -> (dict, Response):
+        """
+        Parameters of the page, the word or the range of pages, or the response to the invalid ones
+
+        Only the query is read, so the async view calls it as is.
+        """
+        # Can't use values() or items() because params might not be in request.
         book_id, page = request.query_params.get('book_id'), request.query_params.get('page')
+        words_per_page = self.parse_words_per_page(request)
+        bad_request = None, Response(BookViewSerializer(None).data, status=status.HTTP_400_BAD_REQUEST)
+        if words_per_page is None:
+            return bad_request
+
+        params = {'book_id': book_id, 'words_per_page': words_per_page}
+        if book_id and 'page_from' in request.query_params:
+            try:
+                page_from = int(request.query_params.get('page_from'))
+                page_to = int(request.query_params.get('page_to', page_from))
+            except ValueError:
+                return bad_request
+
+            if page_from < 1 or page_to < page_from:
+                return bad_request
+
+            page_to = min(page_to, page_from + getattr(settings, 'LIBRARY_MAX_PAGE_RANGE', 16) - 1)
+            return dict(params, page_from=page_from, page_to=page_to), None
+
+        if book_id and not page and 'word' in request.query_params:
+            word = self.parse_word(request)
+            if word is None:
+                return bad_request
+
+            return dict(params, word=word), None
+
         if not book_id or not page:
-            return Response(BookViewSerializer(None).data, status=status.HTTP_400_BAD_REQUEST)
+            return bad_request
 
-        queryset = Book.objects.all().filter(unique_id=book_id)
-        if not queryset.exists():
-            return Response(BookViewSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
+        return dict(params, page=page), None
+
+    @staticmethod
+    def find_book(params: dict) -> Book:
+        return Book.objects.all().filter(unique_id=params['book_id']).first()
+
+    def check_book(self, request: Request, book: Book, params: dict) -> (str, Response):
+        """
+        ETag of the requested text, or the response given without reading the book
+
+        Unknown book, book which isn't ready, word past its end and text the client already has are answered here.
+        """
+        if not book:
+            return None, Response(BookViewSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
+
+        if book.state != Book.State.READY:
+            return None, self.not_ready(book)
+
+        words_per_page = params['words_per_page']
+        if 'word' in params:
+            # There is no page past the last word.
+            if params['word'] >= book.words:
+                return None, Response(BookViewSerializer(None).data, status=status.HTTP_400_BAD_REQUEST)
+
+            etag = position_etag(book, params['word'], words_per_page)
+        elif 'page_from' in params:
+            etag = page_etag(book, params['page_from'], params['page_to'], words_per_page)
+        else:
+            etag = page_etag(book, params['page'], params['page'], words_per_page)
+
+        # Client already has the text, so the book isn't read at all.
+        response = not_modified(request, etag, book.edited)
+        return etag, cache_pages(response) if response is not None else None
+
+    def read(self, book: Book, params: dict):
+        """Response with the page, the page containing the word or the range of pages streamed as read"""
+        words_per_page = params['words_per_page']
+        if 'page_from' in params:
+            serializer = BookViewSerializer(book, context={'words_per_page': words_per_page})
+            pages = serializer.iter_representation(book, params['page_from'], params['page_to'])
+            return StreamingHttpResponse((json.dumps(page) + '\n' for page in pages),
+                                         content_type='application/x-ndjson')
+
+        if 'word' in params:
+            # The word is found by bisection of the page offsets.
+            page, offset = locate_word(book, params['word'], words_per_page)
+            return Response(dict(self.render_page(book, page, words_per_page), word=params['word'], offset=offset))
+
+        return Response(self.render_page(book, params['page'], words_per_page))
+
+    def render_page(self, book: Book, page, words_per_page: int = WORDS_PER_PAGE) -> dict:
+        """Serialized page shared by all the workers"""
+        data = rendered_pages.get(book, page, words_per_page)
+        if data is None:
+            context = {'page': page, 'words_per_page': words_per_page}
+            data = BookViewSerializer(book, partial=True, context=context).data
+            rendered_pages.set(book, page, data, words_per_page)
+
+        return data
+
+    @staticmethod
+    def parse_words_per_page(request: Request):
+        """Page size from the query, the default one if there is none, None if it's invalid"""
+        try:
+            words_per_page = int(request.query_params.get('words_per_page', WORDS_PER_PAGE))
+        except ValueError:
+            return None
 
-        serializer = BookViewSerializer(queryset.first(), partial=True, context={'page': page})
-        return Response(serializer.data)
+        if words_per_page < getattr(settings, 'LIBRARY_MIN_WORDS_PER_PAGE', 16) or \
+                words_per_page > getattr(settings, 'LIBRARY_MAX_WORDS_PER_PAGE', 8192):
+            return None
+
+        return words_per_page
+
+    @staticmethod
+    def parse_word(request: Request):
+        """Word offset from the query, None if it's invalid"""
+        try:
+            word = int(request.query_params.get('word'))
+        except ValueError:
+            return None
+
+        return word if word >= 0 else None
+
+    @staticmethod
+    def not_ready(book: Book) -> Response:
+        """Book text can't be read until the book is ingested"""
+        if book.state == Book.State.FAILED:
+            return Response(BookStateSerializer(book).data, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        return Response(BookStateSerializer(book).data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Retry-After': 1})
 
     def post(self, request, *args, **kwargs):
-        """Send user vk_id and book file"""
+        """Send user vk_id and book file, the book is parsed in the background"""
         vk_id = request.data.get('vk_id')
-        user = User.objects.filter(vk_id=vk_id)
-
-        if not user.exists():
-            user = User.objects.create(vk_id=vk_id)
-            user.save()
+        if vk_id:
+            User.objects.get_or_create(vk_id=vk_id)
 
         book_serialized = BookCreateSerializer(data=request.data)
         if not book_serialized.is_valid():
@@ -74,7 +230,7 @@ class LibraryRetrieveViewSet(
 
         book_serialized.save()
 
-        return Response(book_serialized.data, status=status.HTTP_201_CREATED)
+        return Response(book_serialized.data, status=status.HTTP_202_ACCEPTED)
 
     def delete(self, request: Request, *args, **kwargs):
         """Delete book by book_id"""
@@ -83,14 +239,37 @@ class LibraryRetrieveViewSet(
         if not book_id:
             return Response(BookViewSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
-        book = Book.objects.all().filter(unique_id=book_id)
-        if not book:
+        deleted, _ = Book.objects.all().filter(unique_id=book_id).delete()
+        if not deleted:
             return Response(BookViewSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
-        book.delete()
+        parsed_books.invalidate(book_id)
+        rendered_pages.invalidate(book_id)
         return Response(BookViewSerializer(None).data, status=status.HTTP_200_OK)
 
 
+class LibraryStateViewSet(RetrieveAPIView):
+    """
+    Ingestion state of the uploaded book
+
+    GET by book_id – pending, processing, ready or failed
+    """
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = BookStateSerializer
+
+    def get(self, request: Request, *args, **kwargs):
+        book_id = request.query_params.get('book_id')
+        if not book_id:
+            return Response(BookStateSerializer(None).data, status=status.HTTP_400_BAD_REQUEST)
+
+        book = Book.objects.all().filter(unique_id=book_id).only('unique_id', 'state').first()
+        if not book:
+            return Response(BookStateSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
+
+        return Response(BookStateSerializer(book).data)
+
+
 class StatisticsViewSet(
     RetrieveAPIView,
     UpdateAPIView
@@ -114,25 +293,170 @@ class StatisticsViewSet(
             return Response(LibraryAvgProgressBaseSerializer(request.query_params).data)
 
         # TODO: serializer validation. error during invalid token.
-        # check if the book really belongs to the user
-        book = Book.objects.all().filter(Q(vk_id=vk_id) & Q(unique_id=book_id))
-        if not book.exists():
+        # check if the book really belongs to the user, its statistics are joined
+        book = self.get_book(vk_id, book_id)
+        if not book:
             return Response(LibraryProgressModelSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
-        stat = Statistics.objects.all().filter(book_id=book.first()).first()
+        stat = self.get_statistics(book)
+        if not stat:
+            return Response(LibraryProgressModelSerializer(stat).data)
+
+        etag = statistics_etag(stat)
+        response = not_modified(request, etag, stat.edited)
+        if response is None:
+            response = set_validators(Response(LibraryProgressModelSerializer(stat).data), etag, stat.edited)
+
+        return cache_statistics(response)
 
-        return Response(LibraryProgressModelSerializer(stat).data)
+    @staticmethod
+    def get_book(vk_id, book_id):
+        """Book of the user along with its statistics in a single query"""
+        return Book.objects.all().filter(Q(vk_id=vk_id) & Q(unique_id=book_id)).select_related('statistics').first()
+
+    @staticmethod
+    def get_statistics(book: Book):
+        try:
+            return book.statistics
+        except Statistics.DoesNotExist:
+            return None
 
     def put(self, request, *args, **kwargs):
-        # TODO: Doesn't work, fix late. Update tests.
         vk_id, book_id = request.data.get('vk_id'), request.data.get('book_id')
         if not vk_id or not book_id:
             return Response(LibraryProgressModelSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
-        stat_serialized = LibraryProgressModelSerializer(data=request.data)
+        # check if the book really belongs to the user
+        book = self.get_book(vk_id, book_id)
+        if not book:
+            return Response(LibraryProgressModelSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
+
+        # Existing statistics are updated
+        stat = self.get_statistics(book)
+        stat_serialized = LibraryProgressModelSerializer(stat, data=request.data)
         if not stat_serialized.is_valid():
             return Response(LibraryProgressModelSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
         stat_serialized.save()
 
         return Response(stat_serialized.data, status=status.HTTP_200_OK)
+
+
+class StatisticsBulkViewSet(CreateAPIView):
+    """
+    Batch of the user statistics
+
+    POST vk_id and items of book_id, pages_read, words_read, percentage, average_speed.
+    Returns status of every item: created, updated, duplicate, not_found or invalid.
+    """
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = LibraryProgressBulkSerializer
+
+    def post(self, request, *args, **kwargs):
+        stats_serialized = LibraryProgressBulkSerializer(data=request.data)
+        if not stats_serialized.is_valid():
+            return Response(stats_serialized.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        items = stats_serialized.save()
+
+        return Response({'vk_id': stats_serialized.validated_data['vk_id'], 'items': items})
+
+
+class ReadingEventViewSet(
+    RetrieveAPIView,
+    CreateAPIView
+):
+    """
+    Log of the user reading
+
+    GET vk_id and optional days, words per minute over the last days, 30 by default.
+    POST vk_id and events of book_id, word, words, started, duration.
+    Events are compacted by `manage.py rollup_reading`, the speed includes the compacted ones only.
+    """
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = ReadingEventBulkSerializer
+
+    def get(self, request, *args, **kwargs):
+        vk_id, days = request.query_params.get('vk_id'), request.query_params.get('days', 30)
+        if not vk_id or not str(days).isdigit():
+            return Response(None, status=status.HTTP_204_NO_CONTENT)
+
+        return Response(ReadingSpeedBaseSerializer({'vk_id': vk_id, 'days': int(days)}).data)
+
+    def post(self, request, *args, **kwargs):
+        events_serialized = ReadingEventBulkSerializer(data=request.data)
+        if not events_serialized.is_valid():
+            return Response(events_serialized.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        stored = events_serialized.save()
+        rejected = len(events_serialized.validated_data['events']) - stored
+
+        return Response({'stored': stored, 'rejected': rejected}, status=status.HTTP_201_CREATED)
+
+
+class LibrarySearchViewSet(RetrieveAPIView):
+    """
+    Full-text search across the user library
+
+    GET vk_id, q and optional limit – pages containing the phrase, the most relevant first,
+    with the phrase highlighted in the snippet.
+    """
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = SearchHitSerializer
+
+    def get(self, request: Request, *args, **kwargs):
+        vk_id, query = request.query_params.get('vk_id'), request.query_params.get('q', '').strip()
+        if not vk_id or not query:
+            return Response(None, status=status.HTTP_204_NO_CONTENT)
+
+        limit = request.query_params.get('limit', '20')
+        if not limit.isdigit():
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        limit = min(int(limit), getattr(settings, 'LIBRARY_MAX_SEARCH_HITS', 100))
+        hits = search.search(vk_id, query, limit)
+
+        return Response({'vk_id': vk_id, 'q': query, 'hits': SearchHitSerializer(hits, many=True).data})
+
+
+class LibraryWordsViewSet(RetrieveAPIView):
+    """
+    Word stream of the book for RSVP reading
+
+    GET book_id, word – offset of the first word counted from 0, optional count of the words.
+    Every word comes with its optimal recognition point and delay multiplier.
+    """
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = WordStreamSerializer
+
+    def get(self, request: Request, *args, **kwargs):
+        book_id = request.query_params.get('book_id')
+        try:
+            first = int(request.query_params.get('word'))
+            count = int(request.query_params.get('count', getattr(settings, 'LIBRARY_MAX_RSVP_WORDS', 500)))
+        except (TypeError, ValueError):
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        if not book_id or first < 0 or count < 1:
+            return Response(None, status=status.HTTP_400_BAD_REQUEST)
+
+        count = min(count, getattr(settings, 'LIBRARY_MAX_RSVP_WORDS', 500))
+
+        book = Book.objects.all().filter(unique_id=book_id).first()
+        if not book:
+            return Response(None, status=status.HTTP_204_NO_CONTENT)
+
+        if book.state != Book.State.READY:
+            return LibraryRetrieveViewSet.not_ready(book)
+
+        etag = words_etag(book, first, count)
+        response = not_modified(request, etag, book.edited)
+        if response is None:
+            data = WordStreamSerializer({'book': book, 'word': first, 'count': count}).data
+            response = set_validators(Response(data), etag, book.edited)
+
+        return cache_pages(response)
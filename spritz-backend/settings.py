@@ -65,10 +65,32 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'spritz-backend.wsgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Shared by all the workers, memcached may be used instead.
+    'library': {
+        'BACKEND': getenv("LIBRARY_CACHE_BACKEND", 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': getenv("LIBRARY_CACHE_LOCATION", str(BASE_DIR / 'cache')),
+        'TIMEOUT': 24 * 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # WAL, busy timeout and BEGIN IMMEDIATE, see spritz-backend/sqlite3/base.py
+        'ENGINE': 'spritz-backend.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': getenv("SQLITE_TRANSACTION_MODE", "IMMEDIATE"),
+            'pragmas': {
+                'busy_timeout': int(getenv("SQLITE_BUSY_TIMEOUT", 5000)),
+            },
+        },
     }
 }
 
@@ -96,3 +118,53 @@ STATIC_URL = 'static/'
 MEDIA_URL = 'media/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Per-worker cache of the books opened from their sidecars, bounded by the mapped index and decompressed block bytes.
+LIBRARY_PARSED_BOOKS_CACHE_BYTES = int(getenv("LIBRARY_PARSED_BOOKS_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Processes parsing uploaded books, see `manage.py ingest_books`. None means amount of CPUs.
+LIBRARY_INGEST_WORKERS = int(getenv("LIBRARY_INGEST_WORKERS")) if getenv("LIBRARY_INGEST_WORKERS") else None
+
+# Seconds after which a book still processing is returned to the queue, its worker is considered dead.
+LIBRARY_INGEST_TIMEOUT = int(getenv("LIBRARY_INGEST_TIMEOUT", 600))
+
+# Max amount of pages streamed by a single page range request.
+LIBRARY_MAX_PAGE_RANGE = int(getenv("LIBRARY_MAX_PAGE_RANGE", 16))
+
+# Backend extracting text from the chapters of EPUB-books.
+LIBRARY_TEXT_EXTRACTOR = getenv("LIBRARY_TEXT_EXTRACTOR", "library.extractors.LxmlExtractor")
+
+# Seconds pages may be cached by the clients and CDN.
+LIBRARY_PAGE_MAX_AGE = int(getenv("LIBRARY_PAGE_MAX_AGE", 300))
+
+# Cache of the serialized pages shared by all the workers.
+LIBRARY_PAGE_CACHE = 'library'
+
+# Max amount of books in a single batch of the reading progress.
+LIBRARY_MAX_PROGRESS_BATCH = int(getenv("LIBRARY_MAX_PROGRESS_BATCH", 1000))
+
+# Max amount of reading events in a single batch.
+LIBRARY_MAX_READING_EVENTS = int(getenv("LIBRARY_MAX_READING_EVENTS", 1000))
+
+# Threads reading and parsing books for the async views, see library/async_views.py.
+LIBRARY_ASYNC_WORKERS = int(getenv("LIBRARY_ASYNC_WORKERS", 8))
+
+# Uploads are hashed while they are streamed to disk, see library/blobs.py.
+FILE_UPLOAD_HANDLERS = ['library.uploads.HashingFileUploadHandler']
+
+# Compression of the page text sidecars: none, zlib or lzma, its level and amount of pages compressed together.
+# Bigger blocks take less disk and more time to read a page, see `manage.py bench_library`.
+# Pages stored in the database are compressed one by one with the same codec and level.
+LIBRARY_SIDECAR_CODEC = getenv("LIBRARY_SIDECAR_CODEC", "zlib")
+LIBRARY_SIDECAR_LEVEL = int(getenv("LIBRARY_SIDECAR_LEVEL", 6))
+LIBRARY_SIDECAR_PAGES_PER_BLOCK = int(getenv("LIBRARY_SIDECAR_PAGES_PER_BLOCK", 4))
+
+# Max amount of pages returned by a single search request.
+LIBRARY_MAX_SEARCH_HITS = int(getenv("LIBRARY_MAX_SEARCH_HITS", 100))
+
+# Max amount of words returned by a single request of the RSVP word stream.
+LIBRARY_MAX_RSVP_WORDS = int(getenv("LIBRARY_MAX_RSVP_WORDS", 500))
+
+# Range of the page sizes the clients may read the books by, in words.
+LIBRARY_MIN_WORDS_PER_PAGE = int(getenv("LIBRARY_MIN_WORDS_PER_PAGE", 16))
+LIBRARY_MAX_WORDS_PER_PAGE = int(getenv("LIBRARY_MAX_WORDS_PER_PAGE", 8192))
@@ -0,0 +1,46 @@
+"""
+SQLite backend for several workers sharing a single database file.
+
+Every connection is switched to WAL, so readers are never blocked by the writer,
+and waits for the lock instead of failing with `database is locked`.
+Transactions are started with BEGIN IMMEDIATE: the write lock is taken up front,
+so two transactions can't both read and then deadlock upgrading to write.
+
+OPTIONS of the database:
+    pragmas – overrides of PRAGMAS applied on every connection
+    transaction_mode – DEFERRED, IMMEDIATE or EXCLUSIVE, IMMEDIATE by default
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable on checkpoints, a commit in WAL mode doesn't wait for fsync.
+    'synchronous': 'NORMAL',
+    # Milliseconds to wait for the write lock.
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+TRANSACTION_MODES = ('DEFERRED', 'IMMEDIATE', 'EXCLUSIVE')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.pragmas = {**PRAGMAS, **params.pop('pragmas', {})}
+        self.transaction_mode = params.pop('transaction_mode', 'IMMEDIATE').upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(f'transaction_mode must be one of {", ".join(TRANSACTION_MODES)}')
+
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
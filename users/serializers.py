@@ -1,11 +1,11 @@
 from rest_framework import serializers
 from users.models import User
-from library.serializers import BookViewSerializer
+from library.serializers import BookSummarySerializer
 
 
 class UserSerializer(serializers.ModelSerializer):
     vk_id = serializers.IntegerField()
-    books = BookViewSerializer(many=True, read_only=True)
+    books = BookSummarySerializer(many=True, read_only=True, source='books_id')
 
     # TODO: Return forbidden status code if vk_id is not set.
 
@@ -5,8 +5,11 @@ from django.test import (
 from django.urls import reverse
 from rest_framework import status
 from users.models import User
-from users.serializers import UserSerializer
-from library.models import Book
+from library.models import (
+    Book,
+    Statistics
+)
+from library.serializers import BookSummarySerializer
 
 client = Client()
 
@@ -46,25 +49,68 @@ class TestUserListApiView(TestCase):
 
     def test_get_users(self):
         # get data from API response with vk_id=371449298
-        response = client.get(reverse('api_user:user_info'), data={'vk_id': 371449298})
+        with self.assertNumQueries(2):
+            response = client.get(reverse('api_user:user_info'), data={'vk_id': 371449298})
 
-        # get data from ORM
-        clients = User.objects.get(vk_id=371449298)
-        clients_serialized = UserSerializer(clients)
+        # get data from ORM, the latest edited book first
+        books = Book.objects.all().filter(vk_id=371449298).order_by('-edited', '-id')
+        books_serialized = BookSummarySerializer(books, many=True)
 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, clients_serialized.data)
+        self.assertEqual(response.data['vk_id'], 371449298)
+        self.assertEqual(response.data['books'], books_serialized.data)
+        self.assertIsNone(response.data['next'])
+
+    def test_get_users_progress(self):
+        book = Book.objects.all().filter(vk_id=371449298).first()
+        Statistics.objects.create(book_id=book, percentage=10, pages_read=50, words_read=22900, average_speed=1)
+
+        response = client.get(reverse('api_user:user_info'), data={'vk_id': 371449298})
+        books = {book['unique_id']: book for book in response.data['books']}
+
+        self.assertEqual(books[str(book.unique_id)]['pages_read'], 50)
+        self.assertEqual(len([book for book in books.values() if book['pages_read'] is None]), 2)
+
+    def test_get_users_cursor(self):
+        # get books page by page
+        response = client.get(reverse('api_user:user_info'), data={'vk_id': 371449298, 'page_size': 2})
+        self.assertEqual(len(response.data['books']), 2)
+
+        next_page = client.get(response.data['next'])
+        self.assertEqual(len(next_page.data['books']), 1)
+        self.assertIsNone(next_page.data['next'])
+
+        unique_ids = {book['unique_id'] for book in response.data['books'] + next_page.data['books']}
+        self.assertEqual(len(unique_ids), 3)
+
+    def test_get_users_cursor_same_edited(self):
+        """Books edited at once are neither skipped nor repeated across the pages"""
+        user = User.objects.get(vk_id=371449298)
+        Book.objects.all().filter(vk_id=user).update(edited=Book.objects.all().first().edited)
+
+        unique_ids = []
+        response = client.get(reverse('api_user:user_info'), data={'vk_id': 371449298, 'page_size': 1})
+        while True:
+            unique_ids.extend(book['unique_id'] for book in response.data['books'])
+            if not response.data['next']:
+                break
+            response = client.get(response.data['next'])
+
+        expected = Book.objects.all().filter(vk_id=user).order_by('-id').values_list('unique_id', flat=True)
+        self.assertEqual(unique_ids, [str(unique_id) for unique_id in expected])
 
     def test_get_empty_user(self):
         # get data from API response with vk_id=123123123
         response = client.get(reverse('api_user:user_info'), data={'vk_id': 123123123})
 
-        # get data from ORM
-        clients = User.objects.get(vk_id=123123123)
-        clients_serialized = UserSerializer(clients)
-
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data, clients_serialized.data)
+        self.assertEqual(response.data['vk_id'], 123123123)
+        self.assertEqual(response.data['books'], [])
+
+    def test_get_unknown_user(self):
+        response = client.get(reverse('api_user:user_info'), data={'vk_id': 1})
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
     def test_empty_args(self):
         response = client.get(reverse('api_user:user_info'))
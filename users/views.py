@@ -1,13 +1,25 @@
 from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework import status
 from users.serializers import UserSerializer
 from users.models import User
+from library.models import Book
+from library.serializers import BookSummarySerializer
+
+
+class LibraryCursorPagination(CursorPagination):
+    """Constant time pages of the user library, however big it is"""
+    # Books imported at once have the same edited, id makes the order total.
+    ordering = ('-edited', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
 
 
 class UserListAPIView(RetrieveAPIView):
     """
-    Returns books ID of user with given vk_id
+    Returns books of user with given vk_id, paginated by cursor
 
     * If user didn't upload any books result will be empty
     """
@@ -16,6 +28,7 @@ class UserListAPIView(RetrieveAPIView):
 
     allowed_methods = ['GET']
     serializer_class = UserSerializer
+    pagination_class = LibraryCursorPagination
 
     def get(self, request, *args, **kwargs):
         """
@@ -27,5 +40,20 @@ class UserListAPIView(RetrieveAPIView):
         if not vk_id:
             return Response(UserSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
 
-        queryset = User.objects.get(vk_id=vk_id)
-        return Response(UserSerializer(queryset).data)
+        user = User.objects.filter(vk_id=vk_id).first()
+        if not user:
+            return Response(UserSerializer(None).data, status=status.HTTP_204_NO_CONTENT)
+
+        # Reading progress is joined in the same query.
+        books = Book.objects.all().filter(vk_id=user).select_related('statistics').only(
+            'unique_id', 'title', 'author', 'pages', 'words', 'edited',
+            'statistics__percentage', 'statistics__pages_read', 'statistics__words_read',
+        )
+        page = self.paginate_queryset(books)
+
+        return Response({
+            'vk_id': user.vk_id,
+            'next': self.paginator.get_next_link(),
+            'previous': self.paginator.get_previous_link(),
+            'books': BookSummarySerializer(page, many=True).data,
+        })